@@ -13,14 +13,29 @@
 
 """
 
+import csv
+import functools
+import io
+import json
 import logging
 import os.path
+import pickle
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+
 from SPARQLWrapper import SPARQLWrapper, JSON
 from rcsb.utils.io.FileUtil import FileUtil
 from rcsb.utils.io.MarshalUtil import MarshalUtil
 from rcsb.utils.io.StashableBase import StashableBase
 from rcsb.utils.io.UrlRequestUtil import UrlRequestUtil
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -41,42 +56,70 @@ class GlyGenProvider(StashableBase):
         self.__dirPath = os.path.join(cachePath, dirName)
         super(GlyGenProvider, self).__init__(cachePath, [dirName])
         useCache = kwargs.get("useCache", True)
+        # Retain only the set of glycoprotein UniProt accessions (without isoform numbers)
+        self.__idsOnly = kwargs.get("idsOnly", False)
+        # Cache file format (pickle|json)
+        self.__cacheFmt = kwargs.get("cacheFmt", "pickle")
+        # Send conditional requests (If-Modified-Since) to reuse unchanged glycoprotein files left from a previous primary source download
+        self.__useConditional = kwargs.get("useConditional", False)
         #
         baseUrl = kwargs.get("glygenBasetUrl", "https://data.glygen.org/ln2data/releases/data/v-2.2.1/reviewed/")
         # baseSparqlUrl = kwargs.get("glygenBaseSparqlUrl", "http://sparql.glygen.org:8880/sparql")
         fallbackUrl = kwargs.get("glygenFallbackUrl", "https://raw.githubusercontent.com/rcsb/py-rcsb_exdb_assets/master/fall_back/glygen/")
         #
         self.__mU = MarshalUtil(workPath=self.__dirPath)
-        self.__glycanD, self.__version = self.__reloadGlycans(baseUrl, fallbackUrl, self.__dirPath, useCache=useCache)
-        self.__glycoproteinD = self.__reloadGlycoproteins(baseUrl, fallbackUrl, self.__dirPath, useCache=useCache)
+        self.__fU = FileUtil()
+        self.__uR = UrlRequestUtil()
+        # Cached data are loaded on first access
+        self.__reloadArgs = (baseUrl, fallbackUrl, self.__dirPath, useCache)
+        self.__glycanD = self.__version = self.__glycoproteinD = None
+        if not useCache:
+            # Rebuild now so that the new cache files are in place on return (e.g. for backup())
+            self.__getGlycanD()
+            self.__getGlycoproteinD()
         # self.__glycoproteinD = self.__reloadGlycoproteinsSparql(baseSparqlUrl, fallbackUrl, self.__dirPath, useCache=useCache)
 
     def testCache(self, minGlycanCount=20000, minGlycoproteinCount=64000):
         #
-        logger.info("GlyGen glycan list (%d) glycoprotein list (%d)", len(self.__glycanD), len(self.__glycoproteinD))
-        if self.__glycanD and len(self.__glycanD) > minGlycanCount and self.__glycoproteinD and len(self.__glycoproteinD) > minGlycoproteinCount:
+        glycanD = self.__getGlycanD()
+        glycoproteinD = self.__getGlycoproteinD()
+        logger.info("GlyGen glycan list (%d) glycoprotein list (%d)", len(glycanD), len(glycoproteinD))
+        if glycanD and len(glycanD) > minGlycanCount and glycoproteinD and len(glycoproteinD) > minGlycoproteinCount:
             return True
         return False
 
     def hasGlycan(self, glyTouCanId):
-        try:
-            return glyTouCanId in self.__glycanD
-        except Exception:
-            return False
+        return glyTouCanId in self.__getGlycanD()
 
     def hasGlycoprotein(self, uniProtId):
-        try:
-            return uniProtId in self.__glycoproteinD
-        except Exception:
-            return False
+        return uniProtId in self.__getGlycoproteinD()
 
     def getVersion(self):
+        self.__getGlycanD()
         return self.__version
 
     def getGlycans(self):
-        return self.__glycanD
+        return self.__getGlycanD()
 
     def getGlycoproteins(self):
+        """Return the glycoprotein index.
+
+        Returns:
+            (dict|set): {uniProtId: isoform, ...} or the set of UniProt ids if the provider was created with idsOnly=True
+        """
+        return self.__getGlycoproteinD()
+
+    def __getGlycanD(self):
+        if self.__glycanD is None:
+            baseUrl, fallbackUrl, dirPath, useCache = self.__reloadArgs
+            self.__glycanD, self.__version = self.__reloadGlycans(baseUrl, fallbackUrl, dirPath, useCache=useCache)
+        return self.__glycanD
+
+    def __getGlycoproteinD(self):
+        if self.__glycoproteinD is None:
+            baseUrl, fallbackUrl, dirPath, useCache = self.__reloadArgs
+            gD = self.__reloadGlycoproteins(baseUrl, fallbackUrl, dirPath, useCache=useCache)
+            self.__glycoproteinD = set(gD) if self.__idsOnly else gD
         return self.__glycoproteinD
 
     def __reloadGlycans(self, baseUrl, fallbackUrl, dirPath, useCache=True):
@@ -85,60 +128,57 @@ class GlyGenProvider(StashableBase):
         logger.debug("Using dirPath %r", dirPath)
         self.__mU.mkdir(dirPath)
         #
-        myDataPath = os.path.join(dirPath, "glygen-glycan-list.json")
-        if useCache and self.__mU.exists(myDataPath):
-            fD = self.__mU.doImport(myDataPath, fmt="json")
-            gD = fD["data"]
+        myDataPath = self.__getCacheFilePath(dirPath, "glygen-glycan-list")
+        cacheDataPath = self.__getExistingCacheFilePath(myDataPath)
+        if useCache and cacheDataPath:
+            fD = self.__importCache(cacheDataPath)
+            gD = {sys.intern(k): v for k, v in fD["data"].items()}
             version = fD["version"]
             logger.debug("GlyGen glycan data length %d", len(gD))
         elif not useCache:
             logger.debug("Fetch GlyGen glycan data from primary data source %s", baseUrl)
-            endPoint = os.path.join(baseUrl, "glycan_masterlist.csv")
-            #
-            logger.info("Fetch GlyGen glycan data from primary data source %s", endPoint)
             rawPath = os.path.join(dirPath, "glycan_masterlist.csv")
-            fU = FileUtil()
-            uR = UrlRequestUtil()
-            ret, retCode = uR.get(baseUrl, "glycan_masterlist.csv", {})
-            ok = retCode == 200
-            logger.debug("Fetch GlyGen glycan data status %r", ok)
-            if ok:
-                with open(rawPath, "w", encoding="utf-8") as f:
-                    f.write(ret)
-            #
             versionEndPoint = os.path.join(baseUrl, "release-notes.txt")
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                versionFuture = executor.submit(self.__fetchUrl, baseUrl, "release-notes.txt")
+                _, ok, ret, retCode = self.__fetchWithFallback(baseUrl, fallbackUrl, "glycan_masterlist.csv", rawPath)
+                _, vRet, _ = versionFuture.result()
+            #
             try:
-                uR = UrlRequestUtil()
-                ret, retCode = uR.get(baseUrl, "release-notes.txt", {})
-                version = ret.split(" ")[0].split("v-")[-1]
+                version = vRet.split(" ")[0].split("v-")[-1] if retCode == 200 else "1.0"
             except Exception as e:
                 logger.exception("Failing for %r with %s", versionEndPoint, str(e))
             #
-            if not ok:
-                endPoint = os.path.join(fallbackUrl, "glycan_masterlist.csv")
-                ok = fU.get(endPoint, rawPath)
-                version = "1.0"
-                logger.info("Fetch fallback GlyGen glycan data status %r", ok)
+            if ok:
+                gD = self.__parseGlycanListFromString(ret) if ret is not None else self.__parseGlycanList(rawPath)
             #
             if ok:
-                gD = self.__parseGlycanList(rawPath)
                 fD = {"data": gD, "version": version}
-                ok = self.__mU.doExport(myDataPath, fD, fmt="json")
+                ok = self.__exportCache(myDataPath, fD)
                 logger.info("Exported GlyGen glycan list (%d) version (%r) (%r) %s", len(gD), version, ok, myDataPath)
             #
         return gD, version
 
     def __parseGlycanList(self, filePath):
         gD = {}
-        row = None
         try:
-            rowL = self.__mU.doImport(filePath, fmt="csv", rowFormat="list")
-            logger.debug("Glycan list length (%d)", len(rowL))
-            logger.debug("Row 0 %r", rowL[0])
-            for row in rowL[1:]:
-                gD[row[0]] = row[1]
+            with open(filePath, "r", newline="", encoding="utf-8-sig") as ifh:
+                gD = self.__parseGlycanRows(csv.reader(ifh))
         except Exception as e:
-            logger.exception("Failing for %r (%r) with %s", filePath, row, str(e))
+            logger.exception("Failing for %r with %s", filePath, str(e))
+        return gD
+
+    def __parseGlycanListFromString(self, text):
+        """Parse the glycan list from the text content of glycan_masterlist.csv."""
+        return self.__parseGlycanRows(csv.reader(io.StringIO(text)))
+
+    def __parseGlycanRows(self, reader):
+        gD = {}
+        try:
+            logger.debug("Header row %r", next(reader, None))
+            gD = {row[0]: row[1] for row in reader if len(row) >= 2}
+        except Exception as e:
+            logger.exception("Failing with %s", str(e))
         return gD
 
     def __reloadGlycoproteins(self, baseUrl, fallbackUrl, dirPath, useCache=True):
@@ -147,23 +187,16 @@ class GlyGenProvider(StashableBase):
         logger.debug("Using dirPath %r", dirPath)
         self.__mU.mkdir(dirPath)
         #
-        myDataPath = os.path.join(dirPath, "glygen-glycoprotein-list.json")
-        if useCache and self.__mU.exists(myDataPath):
-            fD = self.__mU.doImport(myDataPath, fmt="json")
-            gD = fD["data"]
+        myDataPath = self.__getCacheFilePath(dirPath, "glygen-glycoprotein-list")
+        cacheDataPath = self.__getExistingCacheFilePath(myDataPath)
+        if useCache and cacheDataPath:
+            fD = self.__importCache(cacheDataPath)
+            gD = {sys.intern(k): v for k, v in fD["data"].items()}
             version = fD["version"]
             logger.debug("GlyGen glycoprotein data length %d", len(gD))
         else:
             #
-            versionEndPoint = os.path.join(baseUrl, "release-notes.txt")
-            try:
-                uR = UrlRequestUtil()
-                ret, retCode = uR.get(baseUrl, "release-notes.txt", {})
-                version = ret.split(" ")[0].split("v-")[-1]
-            except Exception as e:
-                logger.exception("Failing for %r with %s", versionEndPoint, str(e))
-            #
-            for fn in [
+            fnL = [
                 "sarscov1_protein_masterlist.csv",
                 "sarscov2_protein_masterlist.csv",
                 "hcv1b_protein_masterlist.csv",
@@ -173,56 +206,176 @@ class GlyGenProvider(StashableBase):
                 "rat_protein_masterlist.csv",
                 "fruitfly_protein_masterlist.csv",
                 "yeast_protein_masterlist.csv",
-            ]:
-                logger.debug("Fetch GlyGen glycoprotein data from primary data source %s", baseUrl)
-                endPoint = os.path.join(baseUrl, fn)
-                #
-                logger.debug("Fetch GlyGen glycoprotein data from primary data source %s", endPoint)
-                rawPath = os.path.join(dirPath, fn)
-                fU = FileUtil()
-                uR = UrlRequestUtil()
-                ret, retCode = uR.get(baseUrl, fn, {})
-                ok = retCode == 200
-                logger.info("Fetch GlyGen glycoprotein data status %r - %r", ok, endPoint)
-                if ok:
-                    with open(rawPath, "w", encoding="utf-8") as f:
-                        f.write(ret)
-                else:
-                    # Fetch from fallback
-                    endPoint = os.path.join(fallbackUrl, fn)
-                    ok = fU.get(endPoint, rawPath)
-                    logger.info("Fetch fallback GlyGen data status %r - %r", ok, endPoint)
+            ]
+            logger.debug("Fetch GlyGen glycoprotein data from primary data source %s", baseUrl)
+            rawPathD = {fn: os.path.join(dirPath, fn) for fn in fnL}
+            # The fetches are network bound - run them concurrently and process the results serially.
+            with ThreadPoolExecutor(max_workers=len(fnL) + 1) as executor:
+                versionFuture = executor.submit(self.__fetchUrl, baseUrl, "release-notes.txt")
+                futureL = [executor.submit(self.__fetchWithFallback, baseUrl, fallbackUrl, fn, rawPathD[fn], self.__useConditional) for fn in fnL]
+                resultL = [future.result() for future in futureL]
+                _, vRet, _ = versionFuture.result()
+            #
+            versionEndPoint = os.path.join(baseUrl, "release-notes.txt")
+            try:
+                version = vRet.split(" ")[0].split("v-")[-1]
+            except Exception as e:
+                logger.exception("Failing for %r with %s", versionEndPoint, str(e))
+            #
+            for fn, ok, ret, retCode in resultL:
+                if retCode not in [200, 304]:
                     version = "1.0"
-                #
-                if ok:
-                    tD = self.__parseGlycoproteinList(rawPath)
-                    gD.update(tD)
+                if ret is not None:
+                    gD.update(self.__parseGlycoproteinListFromString(ret))
+                elif ok:
+                    gD.update(self.__parseGlycoproteinList(rawPathD[fn]))
             #
             fD = {"data": gD, "version": version}
-            ok = self.__mU.doExport(myDataPath, fD, fmt="json")
+            ok = self.__exportCache(myDataPath, fD)
             logger.info("Exported GlyGen glycoprotein list (%d) version (%r) (%r) %s", len(gD), version, ok, myDataPath)
         #
         return gD
 
+    def __getCacheFilePath(self, dirPath, baseFileName):
+        fExt = ".pic" if self.__cacheFmt == "pickle" else ".json"
+        return os.path.join(dirPath, baseFileName + fExt)
+
+    def __getExistingCacheFilePath(self, filePath):
+        """Return the input cache file path if it exists, or the path of an existing JSON cache file
+        written by prior versions of this module, or None.
+        """
+        if self.__mU.exists(filePath):
+            return filePath
+        jsonFilePath = os.path.splitext(filePath)[0] + ".json"
+        if self.__mU.exists(jsonFilePath):
+            logger.info("Using JSON cache file %r", jsonFilePath)
+            return jsonFilePath
+        return None
+
+    def __importCache(self, filePath):
+        """Read a cache file in pickle or JSON format (using orjson if available)."""
+        if filePath.endswith(".pic"):
+            return self.__mU.doImport(filePath, fmt="pickle")
+        if orjson:
+            with open(filePath, "rb") as ifh:
+                return orjson.loads(ifh.read())
+        return self.__mU.doImport(filePath, fmt="json")
+
+    def __exportCache(self, filePath, obj):
+        """Write a cache file in pickle or JSON format (using orjson if available).
+
+        The content is serialized in memory and written to a temporary file which then replaces
+        the target file, so an interrupted export never leaves a partial cache file.
+        """
+        try:
+            if filePath.endswith(".pic"):
+                data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+            elif orjson:
+                data = orjson.dumps(obj)
+            else:
+                data = json.dumps(obj).encode("utf-8")
+            tmpPath = filePath + ".tmp"
+            with open(tmpPath, "wb") as ofh:
+                ofh.write(data)
+            os.replace(tmpPath, filePath)
+            return True
+        except Exception as e:
+            logger.exception("Failing for %r with %s", filePath, str(e))
+        return False
+
+    def __fetchWithFallback(self, baseUrl, fallbackUrl, fn, rawPath, conditional=False):
+        """Fetch the input file from the primary source, or from the fallback source if the primary fetch fails.
+
+        Content from the primary source is returned and also saved in rawPath, and the time of the download is
+        recorded in the sidecar file rawPath + ".last-modified". Content from the fallback source is fetched
+        directly to rawPath and the sidecar file is removed, so only primary source downloads are revalidated.
+
+        Args:
+            baseUrl (str): base URL of the primary source
+            fallbackUrl (str): base URL of the fallback source
+            fn (str): file name relative to the base URLs
+            rawPath (str): local file path
+            conditional (bool, optional): request the file conditionally on the time recorded for a retained
+                primary source download (HTTP 304 reuses the file in rawPath). Defaults to False.
+
+        Returns:
+            (tuple): (fn, fetch status, primary text content or None, primary HTTP return code or None)
+        """
+        lastModPath = rawPath + ".last-modified"
+        ifModifiedSince = None
+        if conditional and os.path.exists(rawPath) and os.path.exists(lastModPath):
+            with open(lastModPath, "r", encoding="utf-8") as ifh:
+                ifModifiedSince = ifh.read().strip() or None
+        fetchTime = time.time()
+        _, ret, retCode = self.__fetchUrl(baseUrl, fn, ifModifiedSince=ifModifiedSince)
+        logger.info("Fetch GlyGen data status (%r) - %r", retCode, os.path.join(baseUrl, fn))
+        if retCode == 200:
+            with open(rawPath, "w", encoding="utf-8") as f:
+                f.write(ret)
+            with open(lastModPath, "w", encoding="utf-8") as f:
+                f.write(formatdate(fetchTime, usegmt=True))
+            return fn, True, ret, retCode
+        if retCode == 304 and ifModifiedSince:
+            return fn, True, None, retCode
+        #
+        if os.path.exists(lastModPath):
+            os.remove(lastModPath)
+        endPoint = os.path.join(fallbackUrl, fn)
+        ok = self.__fU.get(endPoint, rawPath)
+        logger.info("Fetch fallback GlyGen data status %r - %r", ok, endPoint)
+        return fn, ok, None, retCode
+
+    def __fetchUrl(self, baseUrl, fn, ifModifiedSince=None):
+        """Fetch the text content of the input file relative to the base URL.
+
+        Args:
+            baseUrl (str): base URL of the resource
+            fn (str): file name relative to baseUrl
+            ifModifiedSince (str, optional): if set, only fetch content modified after this HTTP date. Defaults to None.
+
+        Returns:
+            (tuple): (fn, text content or None, HTTP return code or None) - return code 304 if content is unmodified
+        """
+        ret = retCode = None
+        try:
+            if ifModifiedSince:
+                ret, retCode = self.__uR.get(baseUrl, fn, {}, headers=[("If-Modified-Since", ifModifiedSince)], httpCodesCatch=[304])
+            else:
+                ret, retCode = self.__uR.get(baseUrl, fn, {})
+        except Exception as e:
+            logger.error("Failing for %r %r with %s", baseUrl, fn, str(e))
+        return fn, ret, retCode
+
     def __parseGlycoproteinList(self, filePath):
         gD = {}
         try:
-            rowL = self.__mU.doImport(filePath, fmt="csv", rowFormat="list")
-            for row in rowL[1:]:
-                ff = row[0].split("-")
-                gD[ff[0]] = ff[1]
+            with open(filePath, "r", newline="", encoding="utf-8-sig") as ifh:
+                gD = self.__parseGlycoproteinRows(csv.reader(ifh))
         except Exception as e:
             logger.exception("Failing for %r with %s", filePath, str(e))
         return gD
 
+    def __parseGlycoproteinListFromString(self, text):
+        """Parse the glycoprotein list from the text content of a *_protein_masterlist.csv file."""
+        return self.__parseGlycoproteinRows(csv.reader(io.StringIO(text)))
+
+    def __parseGlycoproteinRows(self, reader):
+        gD = {}
+        try:
+            next(reader, None)
+            gD = dict((uniProtId, isoform) for uniProtId, sep, isoform in (row[0].partition("-") for row in reader if row) if sep)
+        except Exception as e:
+            logger.exception("Failing with %s", str(e))
+        return gD
+
     def __reloadGlycoproteinsSparql(self, baseSparqlUrl, dirPath, useCache=True):
         gD = {}
         logger.debug("Using dirPath %r", dirPath)
         self.__mU.mkdir(dirPath)
         #
-        myDataPath = os.path.join(dirPath, "glygen-glycoprotein-list.json")
+        myDataPath = self.__getCacheFilePath(dirPath, "glygen-glycoprotein-list")
         if useCache and self.__mU.exists(myDataPath):
-            gD = self.__mU.doImport(myDataPath, fmt="json")
+            gD = self.__importCache(myDataPath)
             logger.info("GlyGen glycoprotein data length %d", len(gD))
         else:
             for organism, taxId in {
@@ -237,20 +390,15 @@ class GlyGenProvider(StashableBase):
                 "yeast": "4932",
             }.items():
                 logger.info("Fetch GlyGen glycoprotein data for organism %s taxId %s from SPARQL source %s", organism, taxId, baseSparqlUrl)
-                resultL, retL = [], []
-                offset = 0
-                retL = self.__fetchGlycoproteinListSparql(baseSparqlUrl, taxId, offset)
-                while len(retL) > 0:
-                    resultL += retL
-                    offset += len(retL)
-                    retL = self.__fetchGlycoproteinListSparql(baseSparqlUrl, taxId, offset)
+                resultL = self.__fetchGlycoproteinListSparqlPages(baseSparqlUrl, taxId)
                 logger.info("GlyGen glycoprotein data length (%d) for organism %s taxId %s", len(resultL), organism, taxId)
 
                 if len(resultL) > 0:
                     tD = {}
                     for r in resultL:
-                        ff = r.split("-")
-                        tD[ff[0]] = ff[1]
+                        uniProtId, sep, isoform = r.partition("-")
+                        if sep:
+                            tD[uniProtId] = isoform
                     gD.update(tD)
 
             # if len(gD) < 100:
@@ -258,14 +406,39 @@ class GlyGenProvider(StashableBase):
             #     ok = fU.get(endPoint, rawPath)
             #     logger.info("Fetch fallback GlyGen data status %r", ok)
 
-            ok = self.__mU.doExport(myDataPath, gD, fmt="json")
+            ok = self.__exportCache(myDataPath, gD)
             logger.info("Exported GlyGen glycoprotein list (%d) (%r) %s", len(gD), ok, myDataPath)
         return gD
 
-    def __fetchGlycoproteinListSparql(self, baseSparqlUrl, taxId, offset):
+    def __fetchGlycoproteinListSparqlPages(self, baseSparqlUrl, taxId, pageSize=10000, numWorkers=4):
+        """Fetch all result pages for the input taxonomy, requesting up to numWorkers pages concurrently.
+
+        Args:
+            baseSparqlUrl (str): SPARQL endpoint URL
+            taxId (str): NCBI taxonomy identifier
+            pageSize (int, optional): number of results per page. Defaults to 10000.
+            numWorkers (int, optional): number of pages requested concurrently. Defaults to 4.
+
+        Returns:
+            (list): glycoprotein isoform identifiers
+        """
+        resultL = []
+        offset = 0
+        fetchPage = functools.partial(self.__fetchGlycoproteinListSparql, baseSparqlUrl, taxId, limit=pageSize)
+        with ThreadPoolExecutor(max_workers=numWorkers) as executor:
+            while True:
+                retLL = list(executor.map(fetchPage, [offset + ii * pageSize for ii in range(numWorkers)]))
+                for retL in retLL:
+                    resultL += retL
+                    if len(retL) < pageSize:
+                        # A short (or failed) page marks the end of the result set
+                        return resultL
+                offset += numWorkers * pageSize
+
+    def __fetchGlycoproteinListSparql(self, baseSparqlUrl, taxId, offset, limit=10000):
         retL = []
         try:
-            # Set the SPARQL endpoint
+            # Set the SPARQL endpoint (SPARQLWrapper instances hold per-query state so are not shared across threads)
             sparql = SPARQLWrapper(baseSparqlUrl)
 
             # Define the SPARQL query
@@ -281,7 +454,7 @@ class GlyGenProvider(StashableBase):
                 ?protein_uri up:organism <http://purl.uniprot.org/taxonomy/{taxId}> .
                 ?isoform_uri gly:canonical "true"^^<http://www.w3.org/2001/XMLSchema#boolean> .
             }}
-            LIMIT 10000 OFFSET {offset}
+            LIMIT {limit} OFFSET {offset}
             """
 
             # Set the query and the return format
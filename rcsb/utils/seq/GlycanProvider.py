@@ -17,6 +17,11 @@ import time
 from rcsb.utils.io.MarshalUtil import MarshalUtil
 from rcsb.utils.io.StashableBase import StashableBase
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -83,10 +88,12 @@ class GlycanProvider(StashableBase):
 
     def __reload(self, fmt="json", useCache=True):
         mappingFilePath = self.__getMappingFilePath(fmt=fmt)
-        tS = time.strftime("%Y %m %d %H:%M:%S", time.localtime())
-        pcD = {"version": self.__version, "created": tS, "identifiers": {}}
-
         if useCache and self.__mU.exists(mappingFilePath):
             logger.info("reading cached path %r", mappingFilePath)
-            pcD = self.__mU.doImport(mappingFilePath, fmt=fmt)
-        return pcD
+            if fmt == "json" and orjson:
+                with open(mappingFilePath, "rb") as ifh:
+                    return orjson.loads(ifh.read())
+            return self.__mU.doImport(mappingFilePath, fmt=fmt)
+        #
+        tS = time.strftime("%Y %m %d %H:%M:%S", time.localtime())
+        return {"version": self.__version, "created": tS, "identifiers": {}}
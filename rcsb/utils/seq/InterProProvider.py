@@ -11,10 +11,12 @@
 
 import logging
 import os
-import sys
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 
 from rcsb.utils.io.FileUtil import FileUtil
 from rcsb.utils.io.MarshalUtil import MarshalUtil
+from rcsb.utils.seq.TextFileUtil import openTextFile
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +27,7 @@ class InterProProvider(object):
     def __init__(self, **kwargs):
         urlTargetInterPro = kwargs.get("urlTargetInterPro", "https://ftp.ebi.ac.uk/pub/databases/interpro/current_release/entry.list")
         urlTargetInterProFB = "https://github.com/rcsb/py-rcsb_exdb_assets/raw/master/fall_back/InterPro/entry.list"
-        urlTargetInterProParent = kwargs.get("urlTargetInterPro", "https://ftp.ebi.ac.uk/pub/databases/interpro/current_release/ParentChildTreeFile.txt")
+        urlTargetInterProParent = kwargs.get("urlTargetInterProParent", "https://ftp.ebi.ac.uk/pub/databases/interpro/current_release/ParentChildTreeFile.txt")
         urlTargetInterProParentFB = "https://github.com/rcsb/py-rcsb_exdb_assets/raw/master/fall_back/InterPro/ParentChildTreeFile.txt"
         cachePath = kwargs.get("cachePath", ".")
         dirPath = os.path.join(cachePath, "interPro")
@@ -34,6 +36,7 @@ class InterProProvider(object):
         #
         self.__mU = MarshalUtil(workPath=dirPath)
         self.__interProD, self.__interProParentD = self.__rebuildCache(urlTargetInterPro, urlTargetInterProFB, urlTargetInterProParent, urlTargetInterProParentFB, dirPath, useCache)
+        self.__lineageD = None
 
     def getDescription(self, interProId):
         ret = None
@@ -58,12 +61,14 @@ class InterProProvider(object):
 
     #
     def __rebuildCache(self, urlTargetInterPro, urlTargetInterProFB, urlTargetInterProParent, urlTargetInterProParentFB, dirPath, useCache):
-        fmt = "json"
+        fmt = "pickle"
         ext = fmt if fmt == "json" else "pic"
         interProDataPath = os.path.join(dirPath, "interPro-data.%s" % ext)
         #
         logger.debug("Using cache data path %s", dirPath)
         self.__mU.mkdir(dirPath)
+        if useCache:
+            self.__migrateJsonCache(interProDataPath, fmt)
         #
         if useCache and self.__mU.exists(interProDataPath):
             rD = self.__mU.doImport(interProDataPath, fmt=fmt)
@@ -72,44 +77,37 @@ class InterProProvider(object):
             logger.debug("InterPro index length %d parent length %d", len(interProD), len(interProParentD))
         else:
             # ------
-            fU = FileUtil()
-            logger.info("Fetch data from source %s in %s", urlTargetInterPro, dirPath)
-            fp = os.path.join(dirPath, fU.getFileName(urlTargetInterPro))
-            ok = fU.get(urlTargetInterPro, fp)
-            if not ok and self.__useFallBack:
-                fp = os.path.join(dirPath, fU.getFileName(urlTargetInterProFB))
-                ok = fU.get(urlTargetInterProFB, fp)
-                logger.info("Fetch data fallback fetch status is %r", ok)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                entryFuture = executor.submit(self.__fetchWithFallback, urlTargetInterPro, urlTargetInterProFB, dirPath)
+                parentFuture = executor.submit(self.__fetchWithFallback, urlTargetInterProParent, urlTargetInterProParentFB, dirPath)
+                fp, ok = entryFuture.result()
+                parentFp, _ = parentFuture.result()
             interProD = self.__getInterProIndex(fp)
-
             logger.info("Caching %d in %s status %r", len(interProD), interProDataPath, ok)
-            # ------
-            logger.info("Fetch data from source %s in %s", urlTargetInterProParent, dirPath)
-            fp = os.path.join(dirPath, fU.getFileName(urlTargetInterProParent))
-            ok = fU.get(urlTargetInterProParent, fp)
-            if not ok and self.__useFallBack:
-                fp = os.path.join(dirPath, fU.getFileName(urlTargetInterProParentFB))
-                ok = fU.get(urlTargetInterProParentFB, fp)
-                logger.info("Fetch data fallback fetch status is %r", ok)
-            interProParentD = self.__getInterProParents(fp)
+            interProParentD = self.__getInterProParents(parentFp)
             #
-            ok = self.__mU.doExport(interProDataPath, {"index": interProD, "parents": interProParentD}, fmt=fmt)
+            ok = self.__mU.doExport(interProDataPath, {"index": interProD, "parents": interProParentD}, fmt=fmt, pickleProtocol=pickle.HIGHEST_PROTOCOL)
         #
         return interProD, interProParentD
 
+    def __fetchWithFallback(self, url, urlFB, dirPath):
+        """Fetch the input URL into dirPath, trying the fallback URL on failure (useFallBack=True).
+
+        Returns:
+            (tuple): (local file path, fetch status)
+        """
+        fU = FileUtil()
+        logger.info("Fetch data from source %s in %s", url, dirPath)
+        fp = os.path.join(dirPath, fU.getFileName(url))
+        ok = fU.get(url, fp)
+        if not ok and self.__useFallBack:
+            fp = os.path.join(dirPath, fU.getFileName(urlFB))
+            ok = fU.get(urlFB, fp)
+            logger.info("Fetch data fallback fetch status is %r", ok)
+        return fp, ok
+
     def getLineage(self, idCode):
-        pList = []
-        try:
-            pList.append(idCode)
-            pt = self.getParentId(idCode)
-            while (pt is not None) and (pt != 1):
-                pList.append(pt)
-                pt = self.getParentId(pt)
-        except Exception as e:
-            logger.exception("Failing with %s", str(e))
-        #
-        pList.reverse()
-        return pList
+        return list(self.__getLineageD().get(idCode, (idCode,)))
 
     def getLineageWithNames(self, idCode):
         linL = []
@@ -131,17 +129,17 @@ class InterProProvider(object):
     def getTreeNodeList(self, filterD=None):
         dL = []
         try:
-            for idCode, _ in self.__interProD.items():
+            parentD = self.__interProParentD
+            lineageD = self.__getLineageD()
+            for idCode, rD in self.__interProD.items():
                 if filterD and idCode not in filterD:
                     continue
-                displayName = self.getDescription(idCode)
-                pId = self.getParentId(idCode)
-                linL = self.getLineage(idCode)
+                pId = parentD.get(idCode)
                 #
                 if pId is None:
-                    dD = {"id": idCode, "name": displayName, "depth": 0}
+                    dD = {"id": idCode, "name": rD["description"], "depth": 0}
                 else:
-                    dD = {"id": idCode, "name": displayName, "parents": [pId], "depth": len(linL) - 1}
+                    dD = {"id": idCode, "name": rD["description"], "parents": [pId], "depth": len(lineageD.get(idCode, (idCode,))) - 1}
                 dL.append(dD)
         except Exception as e:
             logger.exception("Failing with %s", str(e))
@@ -157,26 +155,57 @@ class InterProProvider(object):
             dict: {idCode: parentIdCode or None}
         """
         interProParentD = {}
-        lineL = self.__mU.doImport(filePath, fmt="list")
         stack = []
-        for line in lineL:
-            content = line.rstrip()  # drop \n
-            row = content.split("--")
-            ff = row[-1].split("::")
-            tS = ff[0].strip()
-            # stack[:] = stack[: len(row) - 1] + [row[-1]]
-            stack[:] = stack[: len(row) - 1] + [tS]
-            for ii, idCode in enumerate(stack):
-                if idCode not in interProParentD:  # prevents overwriting the parent of idCode, in case idCode has already been iterated over in ParentChildTreeFile.txt
-                    interProParentD[idCode] = None if ii == 0 else stack[ii - 1]
-                else:
-                    # This will correct the parent of idCode from being None if it's later identified as having a parent at another point in ParentChildTreeFile.txt
-                    if interProParentD[idCode] is None and ii != 0:
-                        interProParentD[idCode] = stack[ii - 1]
-            logger.debug("Lineage %r", "\t".join(stack))
+        try:
+            with openTextFile(filePath) as ifh:
+                for line in ifh:
+                    content = line.rstrip()  # drop \n
+                    if not content:
+                        continue
+                    tS = content.lstrip("-")
+                    depth = (len(content) - len(tS)) >> 1
+                    tS = tS.split("::", 1)[0].strip()
+                    del stack[depth:]
+                    stack.append(tS)
+                    # Only the new leaf needs processing - the ancestors in the stack were handled when they were added
+                    parentId = stack[-2] if len(stack) > 1 else None
+                    if tS not in interProParentD:  # prevents overwriting the parent of idCode, in case idCode has already been iterated over in ParentChildTreeFile.txt
+                        interProParentD[tS] = parentId
+                    elif interProParentD[tS] is None and parentId is not None:
+                        # This will correct the parent of idCode from being None if it's later identified as having a parent at another point in ParentChildTreeFile.txt
+                        interProParentD[tS] = parentId
+        except Exception as e:
+            logger.error("Unable to read %r %s", filePath, str(e))
         #
         return interProParentD
 
+    def __getLineageD(self):
+        if self.__lineageD is None:
+            self.__lineageD = self.__buildLineageIndex(self.__interProParentD)
+        return self.__lineageD
+
+    def __buildLineageIndex(self, interProParentD):
+        """Precompute the lineage of each node in the InterPro hierarchy.
+
+        Args:
+            interProParentD (dict): {idCode: parentIdCode or None}
+
+        Returns:
+            dict: {idCode: (rootIdCode, ..., idCode)}
+        """
+        lineageD = {}
+        for idCode in interProParentD:
+            pathL = []
+            pt = idCode
+            while pt is not None and pt not in lineageD and pt not in pathL:
+                pathL.append(pt)
+                pt = interProParentD.get(pt)
+            lineage = lineageD.get(pt, ())
+            for node in reversed(pathL):
+                lineage = lineage + (node,)
+                lineageD[node] = lineage
+        return lineageD
+
     def __getInterProIndex(self, filePath):
         """Read CSV file of InterPro accessions and descriptions
 
@@ -188,15 +217,29 @@ class InterProProvider(object):
         """
 
         interProD = {}
-        encodingD = {"encoding": "ascii"} if sys.version_info[0] < 3 else {}
-        rowL = self.__mU.doImport(filePath, fmt="tdd", rowFormat="list", **encodingD)
-        for row in rowL:
-            try:
-                interProId = row[0].strip().upper()
-                interProType = row[1].strip()
-                descr = row[2].strip()
-                interProD[interProId] = {"description": descr, "type": interProType}
-            except Exception:
-                pass
+        numSkipped = 0
+        try:
+            with openTextFile(filePath) as ifh:
+                for line in ifh:
+                    if line.startswith("#"):
+                        continue
+                    row = line.split("\t", 3)
+                    if len(row) < 3:
+                        numSkipped += 1 if line.strip() else 0
+                        continue
+                    interProD[row[0].strip().upper()] = {"description": row[2].strip(), "type": row[1].strip()}
+            if numSkipped:
+                logger.warning("Skipped %d malformed rows in %s", numSkipped, filePath)
+        except Exception as e:
+            logger.error("Unable to read %r %s", filePath, str(e))
+            interProD = {}
         #
         return interProD
+
+    def __migrateJsonCache(self, dataPath, fmt):
+        """Rewrite a legacy JSON cache file in the current cache format (one-time migration)."""
+        jsonDataPath = os.path.splitext(dataPath)[0] + ".json"
+        if fmt == "json" or self.__mU.exists(dataPath) or not self.__mU.exists(jsonDataPath):
+            return False
+        logger.info("Migrating JSON cache %s to %s", jsonDataPath, dataPath)
+        return self.__mU.doExport(dataPath, self.__mU.doImport(jsonDataPath, fmt="json"), fmt=fmt, pickleProtocol=pickle.HIGHEST_PROTOCOL)
@@ -10,35 +10,86 @@
 #                   in place of pdbmap.gz which will eventually be deprecated
 ##
 
+import array
+import contextlib
+import itertools
 import logging
+import operator
 import os
+import pickle
+import shutil
 import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
 from rcsb.utils.io.FileUtil import FileUtil
 from rcsb.utils.io.MarshalUtil import MarshalUtil
 from rcsb.utils.io.StashableBase import StashableBase
+from rcsb.utils.seq.TextFileUtil import openTextFile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+PfamMap = namedtuple("PfamMap", ["pfamId", "authAsymId", "authSeqBeg", "authSeqEnd", "insertBeg", "insertEnd"])
+# Null value for integer columns of the packed mapping (string columns use -1)
+NULL_INT = -(2**31)
+
+
+# Marker returned by _parseInt() for non-numeric text
+_INVALID = object()
+
+
+def _parseInt(tS):
+    """Return the integer value of the stripped text tS, None for an empty/"None" value, or _INVALID."""
+    if not tS or tS == "None":
+        return None
+    if tS.isdecimal() or (tS[0] == "-" and tS[1:].isdecimal()):
+        return int(tS)
+    return _INVALID
+
 
 class PfamProvider(StashableBase):
     """Manage an index of Pfam identifier to description mappings."""
 
     def __init__(self, **kwargs):
         urlTargetPfam = kwargs.get("urlTargetPfam", "https://ftp.ebi.ac.uk/pub/databases/Pfam/current_release/Pfam-A.clans.tsv.gz")
-        urlTargetPfamFB = "https://github.com/rcsb/py-rcsb_exdb_assets/raw/master/fall_back/Pfam/Pfam-A.clans.tsv.gz"
+        urlTargetPfamFB = kwargs.get("urlTargetPfamFB", "https://github.com/rcsb/py-rcsb_exdb_assets/raw/master/fall_back/Pfam/Pfam-A.clans.tsv.gz")
         self.__version = "34.0"
         dirName = "pfam"
         cachePath = kwargs.get("cachePath", ".")
         dirPath = os.path.join(cachePath, dirName)
         super(PfamProvider, self).__init__(cachePath, [dirName])
         useCache = kwargs.get("useCache", True)
+        # Send conditional requests (If-Modified-Since/If-None-Match) to reuse unchanged source files left from a previous download
+        self.__useConditional = kwargs.get("useConditional", False)
         #
         self.__mU = MarshalUtil(workPath=dirPath)
-        self.__pfamD = self.__rebuildCache(urlTargetPfam, urlTargetPfamFB, dirPath, useCache)
-
+        self.__mU.mkdir(dirPath)
+        #
         urlTargetMapPfam = kwargs.get("urlTargetMapPfam", "https://ftp.ebi.ac.uk/pub/databases/msd/sifts/flatfiles/tsv/pdb_pfam_mapping.tsv.gz")
-        urlTargetMapPfamFB = "https://github.com/rcsb/py-rcsb_exdb_assets/raw/master/fall_back/Pfam/pdb_pfam_mapping.tsv.gz"
-        self.__pfamMapD = self.__rebuildMappingCache(urlTargetMapPfam, urlTargetMapPfamFB, dirPath, useCache)
+        urlTargetMapPfamFB = kwargs.get("urlTargetMapPfamFB", "https://github.com/rcsb/py-rcsb_exdb_assets/raw/master/fall_back/Pfam/pdb_pfam_mapping.tsv.gz")
+        # The PDB-Pfam mapping is loaded on first use (getMapping()/testCache())
+        self.__mappingArgs = (urlTargetMapPfam, urlTargetMapPfamFB, dirPath, useCache)
+        self.__pfamMapD = None
+        if not useCache:
+            # Rebuild both caches now (concurrently) so that the new cache files are in place on return (e.g. for backup())
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                pfamFuture = executor.submit(self.__rebuildCache, urlTargetPfam, urlTargetPfamFB, dirPath, useCache)
+                mappingFuture = executor.submit(self.__getPfamMapD)
+                self.__pfamD = pfamFuture.result()
+                mappingFuture.result()
+        else:
+            self.__pfamD = self.__rebuildCache(urlTargetPfam, urlTargetPfamFB, dirPath, useCache)
+            if kwargs.get("preload", False):
+                # Opt-in eager load of the cached PDB-Pfam mapping (e.g. for batch jobs)
+                self.__getPfamMapD()
 
     def getVersion(self):
         return self.__version
@@ -52,12 +103,7 @@ class PfamProvider(StashableBase):
         Returns:
             str: text description of the Pfam domain
         """
-        descr = None
-        try:
-            descr = self.__pfamD[pfamId]
-        except Exception:
-            pass
-        return descr
+        return self.__pfamD.get(pfamId)
 
     def getMapping(self, pdbId):
         """Return the list of Pfam domain assignments for the input PDB identifer along with
@@ -71,25 +117,55 @@ class PfamProvider(StashableBase):
         """
         mapL = []
         try:
-            mapL = self.__pfamMapD[pdbId.upper()]
+            mD = self.__getPfamMapD()
+            # Misses are resolved with dict.get() - no exception is raised for unknown identifiers
+            rng = mD.get("pdbOffsets", {}).get(pdbId if pdbId.isupper() else pdbId.upper()) if mD else None
+            if not rng:
+                return mapL
+            start, end = rng
+            strL = mD["strings"]
+            for ii in range(start, end):
+                authSeqBeg = mD["authSeqBeg"][ii]
+                authSeqEnd = mD["authSeqEnd"][ii]
+                insertBeg = mD["insertBeg"][ii]
+                insertEnd = mD["insertEnd"][ii]
+                mapL.append(
+                    {
+                        "pfamId": strL[mD["pfamId"][ii]],
+                        "authAsymId": strL[mD["authAsymId"][ii]],
+                        "authSeqBeg": authSeqBeg if authSeqBeg != NULL_INT else None,
+                        "authSeqEnd": authSeqEnd if authSeqEnd != NULL_INT else None,
+                        "insertBeg": strL[insertBeg] if insertBeg >= 0 else None,
+                        "insertEnd": strL[insertEnd] if insertEnd >= 0 else None,
+                    }
+                )
         except Exception:
             pass
         return mapL
 
     def testCache(self):
         # Check length ...
-        logger.info("Length pfamD %d pfamMapD %d", len(self.__pfamD), len(self.__pfamMapD))
-        return (len(self.__pfamD) > 19000) and (len(self.__pfamMapD) > 150000)
+        pfamMapD = self.__getPfamMapD()
+        numEntries = len(pfamMapD["pdbOffsets"]) if pfamMapD else 0
+        logger.info("Length pfamD %d pfamMapD %d", len(self.__pfamD), numEntries)
+        return (len(self.__pfamD) > 19000) and (numEntries > 150000)
+
+    def __getPfamMapD(self):
+        if self.__pfamMapD is None:
+            self.__pfamMapD = self.__rebuildMappingCache(*self.__mappingArgs)
+        return self.__pfamMapD
 
     #
     def __rebuildCache(self, urlTargetPfam, urlTargetPfamFB, dirPath, useCache):
         pfamD = {}
-        fmt = "json"
+        fmt = "pickle"
         ext = fmt if fmt == "json" else "pic"
         pfamDataPath = os.path.join(dirPath, "pfam-data.%s" % ext)
         #
         logger.debug("Using cache data path %s", dirPath)
         self.__mU.mkdir(dirPath)
+        if useCache:
+            self.__migrateJsonCache(pfamDataPath, fmt)
         #
         if useCache and self.__mU.exists(pfamDataPath):
             pfamD = self.__mU.doImport(pfamDataPath, fmt=fmt)
@@ -99,14 +175,22 @@ class PfamProvider(StashableBase):
             fU = FileUtil()
             logger.info("Fetch data from source %s in %s", urlTargetPfam, dirPath)
             fp = os.path.join(dirPath, fU.getFileName(urlTargetPfam))
-            ok = fU.get(urlTargetPfam, fp)
-            if not ok:
+            ok, unmodified = self.__fetchFile(fU, urlTargetPfam, fp)
+            if unmodified and self.__isCacheCurrent(pfamDataPath, fp):
+                logger.info("Source unchanged - reusing %s", pfamDataPath)
+                return self.__mU.doImport(pfamDataPath, fmt=fmt)
+            pfamD = self.__getPfamIndex(fp) if ok else {}
+            if not pfamD:
                 fp = os.path.join(dirPath, fU.getFileName(urlTargetPfamFB))
-                ok = fU.get(urlTargetPfamFB, fp)
+                ok, _ = self.__fetchFile(fU, urlTargetPfamFB, fp, fallback=True)
                 logger.info("Fetch data fallback fetch status is %r", ok)
-            pfamD = self.__getPfamIndex(fp)
-            ok = self.__mU.doExport(pfamDataPath, pfamD, fmt=fmt)
-            logger.info("Caching %d in %s status %r", len(pfamD), pfamDataPath, ok)
+                pfamD = self.__getPfamIndex(fp) if ok else {}
+            # a failed read (e.g. a truncated source file) is not cached
+            if pfamD:
+                ok = self.__mU.doExport(pfamDataPath, pfamD, fmt=fmt, pickleProtocol=pickle.HIGHEST_PROTOCOL)
+                logger.info("Caching %d in %s status %r", len(pfamD), pfamDataPath, ok)
+            else:
+                logger.error("No Pfam data read from %s or %s", urlTargetPfam, urlTargetPfamFB)
             # ------
         #
         return pfamD
@@ -116,46 +200,69 @@ class PfamProvider(StashableBase):
         #
         """
         pfamD = {}
-        encodingD = {"encoding": "ascii"} if sys.version_info[0] < 3 else {}
-        rowL = self.__mU.doImport(filePath, fmt="tdd", rowFormat="list", **encodingD)
-        for row in rowL:
-            try:
-                pfamId = row[0].strip().upper()
-                idCode = row[3].strip()
-                descr = row[4].strip()
-                pfamD[pfamId] = descr + " (" + idCode + ")"
-            except Exception:
-                pass
+        getCols = operator.itemgetter(0, 3, 4)
+        _strip = str.strip
+        numSkipped = 0
+        firstSkipped = None
+        try:
+            with openTextFile(filePath) as ifh:
+                for line in ifh:
+                    if line.startswith("#"):
+                        continue
+                    row = line.split("\t")
+                    if len(row) < 5:
+                        if line.strip():
+                            numSkipped += 1
+                            firstSkipped = firstSkipped or line
+                        continue
+                    pfamId, idCode, descr = map(_strip, getCols(row))
+                    pfamD[pfamId.upper()] = descr + " (" + idCode + ")"
+            if numSkipped:
+                logger.warning("Skipped %d malformed index rows in %s (first: %r)", numSkipped, filePath, firstSkipped)
+        except Exception as e:
+            logger.error("Unable to read %r %s", filePath, str(e))
+            pfamD = {}
         #
         return pfamD
 
     def __rebuildMappingCache(self, urlTargetPfam, urlTargetPfamFB, dirPath, useCache):
-        fmt = "json"
+        fmt = "pickle"
         ext = fmt if fmt == "json" else "pic"
         pfamDataPath = os.path.join(dirPath, "pfam-mapping-data.%s" % ext)
         #
         logger.debug("Using cache data path %s", dirPath)
         self.__mU.mkdir(dirPath)
+        if useCache:
+            self.__migrateJsonCache(pfamDataPath, fmt, convertFn=lambda dD: self.__packPfamMapping({pdbId: [PfamMap(**rD) for rD in rL] for pdbId, rL in dD.items()}))
         #
         if useCache and self.__mU.exists(pfamDataPath):
             pfamD = self.__mU.doImport(pfamDataPath, fmt=fmt)
-            logger.debug("Pfam mapping data length %d", len(pfamD))
+            logger.debug("Pfam mapping data length %d", len(pfamD["pdbOffsets"]) if pfamD else 0)
         else:
             # ------
             fU = FileUtil()
             logger.info("Fetch data from source %s in %s", urlTargetPfam, dirPath)
             fp = os.path.join(dirPath, fU.getFileName(urlTargetPfam))
-            ok = fU.get(urlTargetPfam, fp)
+            ok, unmodified = self.__fetchFile(fU, urlTargetPfam, fp)
+            if unmodified and self.__isCacheCurrent(pfamDataPath, fp):
+                logger.info("Source unchanged - reusing %s", pfamDataPath)
+                return self.__mU.doImport(pfamDataPath, fmt=fmt)
             pfamD = {}
             if ok:
                 pfamD = self.__getPfamMapping(fp)
             if not (ok and pfamD):
                 fp = os.path.join(dirPath, fU.getFileName(urlTargetPfamFB))
-                ok = fU.get(urlTargetPfamFB, fp)
+                ok, _ = self.__fetchFile(fU, urlTargetPfamFB, fp, fallback=True)
                 logger.info("Fetch data fallback fetch status is %r", ok)
-                pfamD = self.__getPfamMapping(fp)
-            ok = self.__mU.doExport(pfamDataPath, pfamD, fmt=fmt)
-            logger.info("Caching %d in %s status %r", len(pfamD), pfamDataPath, ok)
+                pfamD = self.__getPfamMapping(fp) if ok else {}
+            # a failed read (e.g. a truncated source file) is not cached
+            if not pfamD:
+                logger.error("No Pfam mapping data read from %s or %s", urlTargetPfam, urlTargetPfamFB)
+                return {}
+            logger.info("Caching %d in %s", len(pfamD), pfamDataPath)
+            pfamD = self.__packPfamMapping(pfamD)
+            ok = self.__mU.doExport(pfamDataPath, pfamD, fmt=fmt, pickleProtocol=pickle.HIGHEST_PROTOCOL)
+            logger.info("Caching status %r", ok)
             # ------
         #
         return pfamD
@@ -163,38 +270,174 @@ class PfamProvider(StashableBase):
     def __getPfamMapping(self, filePath):
         """Parse mapping data"""
         pFamMapD = {}
-        encodingD = {"encoding": "ascii"} if sys.version_info[0] < 3 else {}
-        dataL = self.__mU.doImport(filePath, fmt="csv", csvDelimiter="\t", **encodingD)
-        for rD in dataL:
-            try:
-                pdbId = rD["PDB"].strip().upper()
-                pfamId = rD["PFAM_ACCESSION"].strip().upper()
-                authAsymId = rD["CHAIN"].strip().upper()
-                #
-                authSeqBegRaw = rD["AUTH_PDBRES_START"].strip()
-                authSeqBeg = int(authSeqBegRaw) if authSeqBegRaw and authSeqBegRaw != "None" else None
-                #
-                insertBegRaw = rD["AUTH_PDBRES_START_INS_CODE"].strip()
-                insertBeg = insertBegRaw if insertBegRaw and insertBegRaw != "None" else None
-                #
-                authSeqEndRaw = rD["AUTH_PDBRES_END"].strip()
-                authSeqEnd = int(authSeqEndRaw) if authSeqEndRaw and authSeqEndRaw != "None" else None
-                #
-                insertEndRaw = rD["AUTH_PDBRES_END_INS_CODE"].strip()
-                insertEnd = insertEndRaw if insertEndRaw and insertEndRaw != "None" else None
-                #
-                pFamMapD.setdefault(pdbId, []).append(
-                    {
-                        "pfamId": pfamId,
-                        "authAsymId": authAsymId,
-                        "authSeqBeg": authSeqBeg,
-                        "authSeqEnd": authSeqEnd,
-                        "insertBeg": insertBeg,
-                        "insertEnd": insertEnd,
-                    }
-                )
-            except Exception as e:
-                logger.exception("Failing with %r %s", rD, str(e))
+        colNameL = ["PDB", "PFAM_ACCESSION", "CHAIN", "AUTH_PDBRES_START", "AUTH_PDBRES_START_INS_CODE", "AUTH_PDBRES_END", "AUTH_PDBRES_END_INS_CODE"]
+        try:
+            with openTextFile(filePath) as ifh:
+                # The file is unquoted TSV - a plain split of the decoded line is cheaper than csv.reader
+                lineIt = itertools.dropwhile(lambda x: x.startswith("#"), ifh)
+                header = [name.strip() for name in next(lineIt).split("\t")]
+                colIndexL = [header.index(name) for name in colNameL]
+                minLen = max(colIndexL) + 1
+                # Column selection and stripping run in C (itemgetter/map) rather than as per-field Python indexing
+                getCols = operator.itemgetter(*colIndexL)
+                _strip = str.strip
+                _none = "None"
+                _intern = sys.intern
+                # The file is grouped by PDB id - track the current entry's list to skip a dict lookup per row
+                lastPdbId = None
+                append = None
+                numSkipped = 0
+                firstSkipped = None
+                for line in lineIt:
+                    row = line.split("\t")
+                    if len(row) < minLen:
+                        if line.strip():
+                            numSkipped += 1
+                            firstSkipped = firstSkipped or line
+                        continue
+                    pdbId, pfamId, authAsymId, authSeqBegRaw, insertBegRaw, authSeqEndRaw, insertEndRaw = map(_strip, getCols(row))
+                    authSeqBeg = _parseInt(authSeqBegRaw)
+                    authSeqEnd = _parseInt(authSeqEndRaw)
+                    if not pdbId or authSeqBeg is _INVALID or authSeqEnd is _INVALID:
+                        numSkipped += 1
+                        firstSkipped = firstSkipped or line
+                        continue
+                    if pdbId != lastPdbId:
+                        mapL = pFamMapD.get(pdbId.upper())
+                        if mapL is None:
+                            mapL = pFamMapD[pdbId.upper()] = []
+                        append = mapL.append
+                        lastPdbId = pdbId
+                    append(
+                        PfamMap(
+                            _intern(pfamId.upper()),
+                            _intern(authAsymId.upper()),
+                            authSeqBeg,
+                            authSeqEnd,
+                            _intern(insertBegRaw) if insertBegRaw and insertBegRaw != _none else None,
+                            _intern(insertEndRaw) if insertEndRaw and insertEndRaw != _none else None,
+                        )
+                    )
+                if numSkipped:
+                    logger.warning("Skipped %d malformed mapping rows in %s (first: %r)", numSkipped, filePath, firstSkipped)
+        except Exception as e:
+            logger.error("Unable to read %r %s", filePath, str(e))
+            pFamMapD = {}
         #
         logger.info("Pfam mapping data for (%d) entries", len(pFamMapD))
         return pFamMapD
+
+    def __packPfamMapping(self, pfamMapD):
+        """Pack the parsed mapping into columnar form.
+
+        Args:
+            pfamMapD (dict): {pdbId: [PfamMap, ...], ...}
+
+        Returns:
+            dict: {"pdbOffsets": {pdbId: (start, end)}, "strings": [str, ...], <PfamMap field>: array, ...}
+
+            where rows for pdbId are [start, end) in each column, integer columns use NULL_INT for
+            missing values and string columns hold indices into "strings" (-1 for missing values).
+        """
+        strL = []
+        strIndexD = {}
+        colD = {colName: array.array("i") for colName in PfamMap._fields}
+        pdbOffsetD = {}
+
+        def strIndex(tS):
+            if tS is None:
+                return -1
+            ind = strIndexD.get(tS)
+            if ind is None:
+                ind = strIndexD[tS] = len(strL)
+                strL.append(tS)
+            return ind
+
+        #
+        numRows = 0
+        for pdbId, mapL in pfamMapD.items():
+            for pfamMap in mapL:
+                colD["pfamId"].append(strIndex(pfamMap.pfamId))
+                colD["authAsymId"].append(strIndex(pfamMap.authAsymId))
+                colD["authSeqBeg"].append(pfamMap.authSeqBeg if pfamMap.authSeqBeg is not None else NULL_INT)
+                colD["authSeqEnd"].append(pfamMap.authSeqEnd if pfamMap.authSeqEnd is not None else NULL_INT)
+                colD["insertBeg"].append(strIndex(pfamMap.insertBeg))
+                colD["insertEnd"].append(strIndex(pfamMap.insertEnd))
+            pdbOffsetD[pdbId] = (numRows, numRows + len(mapL))
+            numRows += len(mapL)
+        #
+        colD["pdbOffsets"] = pdbOffsetD
+        colD["strings"] = strL
+        return colD
+
+    def __fetchFile(self, fU, url, filePath, fallback=False):
+        """Fetch the input URL to a local file, reusing a previously downloaded copy if the source is unchanged (useConditional=True).
+
+        With useConditional=True, a download from the primary source records the response ETag in the sidecar
+        file filePath + ".etag", and only a local copy with a sidecar is requested conditionally. Any other download
+        (fallback=True or useConditional=False) removes the sidecar, so a copy fetched from a fallback source is
+        never revalidated against the primary source.
+
+        Args:
+            fU (obj): FileUtil instance used for unconditional fetches
+            url (str): source URL
+            filePath (str): local file path
+            fallback (bool, optional): url is a fallback source. Defaults to False.
+
+        Returns:
+            (bool, bool): fetch status, True if the existing local copy was reused (HTTP 304)
+        """
+        etagPath = filePath + ".etag"
+        if fallback or not self.__useConditional:
+            if self.__mU.exists(etagPath):
+                os.remove(etagPath)
+            return fU.get(url, filePath), False
+        #
+        headerD = {}
+        if self.__mU.exists(filePath) and self.__mU.exists(etagPath):
+            headerD["If-Modified-Since"] = formatdate(os.path.getmtime(filePath), usegmt=True)
+            with open(etagPath, "r", encoding="utf-8") as ifh:
+                etag = ifh.read().strip()
+            if etag:
+                headerD["If-None-Match"] = etag
+        try:
+            with contextlib.closing(urlopen(Request(url, headers=headerD), timeout=60)) as resp:
+                tmpPath = filePath + ".tmp"
+                with open(tmpPath, "wb") as ofh:
+                    shutil.copyfileobj(resp, ofh, 1 << 20)
+                os.replace(tmpPath, filePath)
+                etag = resp.headers.get("ETag")
+            with open(etagPath, "w", encoding="utf-8") as ofh:
+                ofh.write(etag or "")
+            logger.info("Fetched modified source file %s", url)
+            return True, False
+        except HTTPError as e:
+            if e.code == 304 and headerD:
+                logger.info("Reusing unmodified source file %s", filePath)
+                return True, True
+            logger.error("Failing for %r with %s", url, str(e))
+        except Exception as e:
+            logger.error("Failing for %r with %s", url, str(e))
+        return False, False
+
+    def __isCacheCurrent(self, dataPath, srcPath):
+        """Return True if the cache file exists and was written after the source file."""
+        try:
+            return self.__mU.exists(dataPath) and os.path.getmtime(dataPath) >= os.path.getmtime(srcPath)
+        except OSError:
+            return False
+
+    def __migrateJsonCache(self, dataPath, fmt, convertFn=None):
+        """Rewrite a legacy JSON cache file in the current cache format (one-time migration)."""
+        jsonDataPath = os.path.splitext(dataPath)[0] + ".json"
+        if fmt == "json" or self.__mU.exists(dataPath) or not self.__mU.exists(jsonDataPath):
+            return False
+        logger.info("Migrating JSON cache %s to %s", jsonDataPath, dataPath)
+        if orjson:
+            with open(jsonDataPath, "rb") as ifh:
+                obj = orjson.loads(ifh.read())
+        else:
+            obj = self.__mU.doImport(jsonDataPath, fmt="json")
+        if convertFn:
+            obj = convertFn(obj)
+        return self.__mU.doExport(dataPath, obj, fmt=fmt, pickleProtocol=pickle.HIGHEST_PROTOCOL)
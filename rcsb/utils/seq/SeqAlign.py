@@ -24,16 +24,20 @@ if sys.version_info[0] < 3:
 logger = logging.getLogger(__name__)
 
 
+def _doSpansOverlap(s1, e1, s2, e2):
+    # spans are (start, stop) pairs with range() semantics - empty spans never overlap
+    return s1 != e1 and s2 != e2 and s1 < e2 and e1 > s2
+
+
 def doRangesOverlap(r1, r2):
-    if r1.start == r1.stop or r2.start == r2.stop:
-        return False
-    return (r1.start < r2.stop and r1.stop > r2.start) or (r1.stop > r2.start and r2.stop > r1.start)
+    return _doSpansOverlap(r1.start, r1.stop, r2.start, r2.stop)
 
 
 def getRangeOverlap(r1, r2):
+    """Return the positions shared by the input ranges as a range object (wrap with set() if set operations are required)"""
     if not doRangesOverlap(r1, r2):
-        return set()
-    return set(range(max(r1.start, r2.start), min(r1.stop, r2.stop) + 1))
+        return range(0)
+    return range(max(r1.start, r2.start), min(r1.stop, r2.stop) + 1)
 
 
 def splitSeqAlignObjList(seqAlignObjL):
@@ -48,27 +52,68 @@ def splitSeqAlignObjList(seqAlignObjL):
     grpD = {}
     numG = 0
     try:
-        seqAlignObjL.sort(key=lambda saObj: saObj.getEntityRange().stop - saObj.getEntityRange().start, reverse=True)
+        # Compute each entity range once as a (start, stop) pair
+        rngD = {}
+        for saObj in seqAlignObjL:
+            rng = saObj.getEntityRange()
+            rngD[id(saObj)] = (rng.start, rng.stop)
+        seqAlignObjL.sort(key=lambda saObj: rngD[id(saObj)][1] - rngD[id(saObj)][0], reverse=True)
+        # For each group keep the member ranges and the bounding span (min start, max stop) of its members -
+        # a range that misses the span cannot overlap any member so the member scan is skipped.
+        grpRngD = {}
+        grpSpanD = {}
         for saObj in seqAlignObjL:
+            rStart, rStop = rngD[id(saObj)]
             inGroup = False
             igrp = 0
-            for grp, tsaObjL in grpD.items():
-                inGroup = any([doRangesOverlap(saObj.getEntityRange(), tsaObj.getEntityRange()) for tsaObj in tsaObjL])
+            for grp, (spanStart, spanStop) in grpSpanD.items():
+                if rStart >= spanStop or rStop <= spanStart:
+                    continue
+                inGroup = any(_doSpansOverlap(rStart, rStop, tStart, tStop) for tStart, tStop in grpRngD[grp])
                 if inGroup:
                     igrp = grp
                     break
             numG = numG if inGroup else numG + 1
             igrp = igrp if inGroup else numG
             grpD.setdefault(igrp, []).append(saObj)
+            grpRngD.setdefault(igrp, []).append((rStart, rStop))
+            spanStart, spanStop = grpSpanD.get(igrp, (rStart, rStop))
+            grpSpanD[igrp] = (min(spanStart, rStart), max(spanStop, rStop))
     except Exception as e:
         logger.exception("Failing with %s", str(e))
     return grpD
 
 
+def _toIntOrNone(val):
+    try:
+        return int(val)
+    except Exception:
+        pass
+    return None
+
+
 class SeqAlign(object):
     """ """
 
+    __slots__ = (
+        "__entitySeqIdBeg",
+        "__entitySeqIdEnd",
+        "__entityAlignLength",
+        "__dbSeqIdBeg",
+        "__dbSeqIdEnd",
+        "__dbName",
+        "__dbAccession",
+        "__dbIsoform",
+        "__entitySeqIdBegInt",
+        "__entitySeqIdEndInt",
+        "__dbSeqIdBegInt",
+        "__dbSeqIdEndInt",
+        "__entityRange",
+    )
+
     def __init__(self, alignType, **kwargs):
+        self.__entitySeqIdBeg = self.__entitySeqIdEnd = self.__entityAlignLength = None
+        self.__dbSeqIdBeg = self.__dbSeqIdEnd = self.__dbName = self.__dbAccession = self.__dbIsoform = None
         if alignType == "PDB":
             self.__entitySeqIdBeg = kwargs.get("entitySeqIdBeg", None)
             self.__entitySeqIdEnd = kwargs.get("entitySeqIdEnd", None)
@@ -89,41 +134,30 @@ class SeqAlign(object):
             self.__dbAccession = kwargs.get("UP", None)
             self.__dbIsoform = None
         #
+        # Integer coordinates (or None) are converted once here rather than in each getter
+        self.__entitySeqIdBegInt = _toIntOrNone(self.__entitySeqIdBeg)
+        self.__entitySeqIdEndInt = _toIntOrNone(self.__entitySeqIdEnd)
+        self.__dbSeqIdBegInt = _toIntOrNone(self.__dbSeqIdBeg)
+        self.__dbSeqIdEndInt = _toIntOrNone(self.__dbSeqIdEnd)
+        if self.__entitySeqIdBegInt is not None and self.__entitySeqIdEndInt is not None:
+            self.__entityRange = range(self.__entitySeqIdBegInt, self.__entitySeqIdEndInt + 1)
+        else:
+            self.__entityRange = None
 
     def getEntityRange(self):
-        try:
-            return range(int(self.__entitySeqIdBeg), int(self.__entitySeqIdEnd) + 1)
-        except Exception:
-            pass
-        return None
+        return self.__entityRange
 
     def getEntitySeqIdBeg(self):
-        try:
-            return int(self.__entitySeqIdBeg)
-        except Exception:
-            pass
-        return None
+        return self.__entitySeqIdBegInt
 
     def getEntitySeqIdEnd(self):
-        try:
-            return int(self.__entitySeqIdEnd)
-        except Exception:
-            pass
-        return None
+        return self.__entitySeqIdEndInt
 
     def getDbSeqIdBeg(self):
-        try:
-            return int(self.__dbSeqIdBeg)
-        except Exception:
-            pass
-        return None
+        return self.__dbSeqIdBegInt
 
     def getDbSeqIdEnd(self):
-        try:
-            return int(self.__dbSeqIdEnd)
-        except Exception:
-            pass
-        return None
+        return self.__dbSeqIdEndInt
 
     def getEntityAlignLength(self):
         length = None
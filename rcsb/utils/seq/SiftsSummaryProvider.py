@@ -16,16 +16,367 @@ __author__ = "John Westbrook"
 __email__ = "jwest@rcsb.rutgers.edu"
 __license__ = "Apache 2.0"
 
+import csv
 import logging
+import multiprocessing
+import operator
 import os
+import pickle
+import sqlite3
 import sys
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 
+from rcsb.utils.io.IoUtil import uncommentFilter
 from rcsb.utils.io.MarshalUtil import MarshalUtil
 from rcsb.utils.io.StashableBase import StashableBase
 from rcsb.utils.seq.SeqAlign import SeqAlign
+from rcsb.utils.seq.TextFileUtil import openTextFile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import polars
+except ImportError:
+    polars = None
 
 logger = logging.getLogger(__name__)
 
+_ID_TYPES = frozenset(["UNPAL", "UNPID", "PFAMID", "GOID", "IPROID", "TAXID", "CATHID", "SCOPID", "ECID"])
+# UNPAL alignment records are stored as compact tuples of these fields (older caches hold the equivalent dictionaries)
+_UNPAL_KEYS = ("UP", "BG", "LEN", "UBG", "UND")
+
+
+def _toAlignmentDictList(recL):
+    """Return the input UNPAL records as a list of dictionaries {"UP": ..., "BG": ..., "LEN": ..., "UBG": ..., "UND": ...}."""
+    return [rec if isinstance(rec, dict) else dict(zip(_UNPAL_KEYS, rec)) for rec in recL]
+
+
+def _iterSiftsSummaryFile(filePath, columns=None):
+    """Iterate over the rows of the input SIFTS summary file (following the header row).
+
+    Args:
+        filePath (str): input SIFTS summary CSV file path
+        columns (list, optional): yield only tuples of the values of these named columns (read with polars if installed). Defaults to None.
+
+    Yields:
+        (list|tuple): row value list or (with columns) tuple of the selected column values
+
+    Raises:
+        (Exception): read failures (e.g. a missing or truncated file) are passed to the caller
+    """
+    if columns and polars is not None:
+        try:
+            df = polars.read_csv(filePath, columns=columns, comment_prefix="#", infer_schema_length=0).fill_null("")
+        except Exception as e:
+            logger.warning("Reading %s with polars failing (%s) - using csv reader", filePath, str(e))
+        else:
+            logger.info("Length of SIFTS summary file %s %d", os.path.basename(filePath), df.height)
+            yield from zip(*[df.get_column(column).to_list() for column in columns])
+            return
+    with openTextFile(filePath) as ifh:
+        reader = csv.reader(uncommentFilter(ifh))
+        header = next(reader)
+        if not columns:
+            yield from reader
+        else:
+            indexL = [header.index(column) for column in columns]
+            minLen = max(indexL) + 1
+            getCols = operator.itemgetter(*indexL)
+            for row in reader:
+                if len(row) >= minLen:
+                    yield getCols(row)
+        logger.info("Length of SIFTS summary file %s %d", os.path.basename(filePath), reader.line_num - 1)
+
+
+def _getUniprotChainMapping(siftsSummaryDirPath, csvFileName):
+    """Integrated SIFTS summary instance-level uniprot mapping data."""
+    #
+    #
+    fp = os.path.join(siftsSummaryDirPath, csvFileName)
+    rowIt = _iterSiftsSummaryFile(fp, columns=["PDB", "CHAIN", "SP_PRIMARY", "RES_BEG", "RES_END", "SP_BEG", "SP_END"])
+    uD = {}
+    # accessions repeat across many chains - share a single string object per value (also shrinks the pickle cache via its memo)
+    _intern = sys.intern
+    # rows are grouped by entry - upper-case the id and look up its dict only when the entry changes
+    lastEntryId = eD = None
+    numSkipped = 0
+    # uIdD = {}
+    for entryId, chainId, unpId, resBeg, resEnd, spBeg, spEnd in rowIt:
+        unpId = _intern(unpId)
+        if entryId != lastEntryId:
+            eD = uD.setdefault(entryId.upper(), {})
+            lastEntryId = entryId
+        chainD = eD.get(chainId)
+        if chainD is None:
+            # multi-character chain ids (e.g. "AA") recur across entries and are kept as chain keys in the cache
+            chainD = eD[_intern(chainId)] = {"UNPAL": [], "UNPID": set()}
+        chainD["UNPID"].add(unpId)
+        #
+        # convert with int() directly (no separate isdigit() test) - rows without an entity range cannot be aligned
+        try:
+            entitySeqBeg = int(resBeg)
+            entityLength = int(resEnd) - entitySeqBeg + 1
+        except ValueError:
+            numSkipped += 1
+            continue
+        # authSeqBeg = int(rowD["PDB_BEG"]) if rowD["PDB_BEG"].isdigit() else None
+        # authSeqEnd = int(rowD["PDB_END"]) if rowD["PDB_END"].isdigit() else None
+        unpSeqBeg = int(spBeg) if spBeg.isdigit() else None
+        unpSeqEnd = int(spEnd) if spEnd.isdigit() else None
+        # dD = {"UP": unpId, "BG": entitySeqBeg, "ND": entitySeqEnd, "AUBG": authSeqBeg, "AUND": authSeqEnd, "UBG": unpSeqBeg, "UND": unpSeqEnd}
+        # dD = {"UP": unpId, "BG": entitySeqBeg, "UBG": unpSeqBeg, "LEN": entityLength}
+        # record fields as in _UNPAL_KEYS
+        chainD["UNPAL"].append((unpId, entitySeqBeg, entityLength, unpSeqBeg, unpSeqEnd))
+        #
+    if numSkipped:
+        logger.warning("Skipped %d UniProt alignment rows without an entity sequence range in %s", numSkipped, csvFileName)
+    for eD in uD.values():
+        for chainD in eD.values():
+            chainD["UNPID"] = sorted(chainD["UNPID"])
+    logger.info("UniProt mapping for %d entries", len(uD))
+    # -----
+    return uD
+
+
+def _getPfamChainMapping(siftsSummaryDirPath, csvFileName):
+    """Integrated SIFTS summary instance-level PFAM mapping data."""
+    fp = os.path.join(siftsSummaryDirPath, csvFileName)
+    rowIt = _iterSiftsSummaryFile(fp, columns=["PDB", "CHAIN", "PFAM_ID"])
+    tD = {}
+    _intern = sys.intern
+    lastEntryId = eD = None
+    numSkipped = 0
+    firstSkipped = None
+    for entryId, chainId, pfamId in rowIt:
+        if not pfamId.startswith("PF"):
+            numSkipped += 1
+            firstSkipped = firstSkipped or (entryId, chainId, pfamId)
+            continue
+        if entryId != lastEntryId:
+            eD = tD.setdefault(entryId.upper(), {})
+            lastEntryId = entryId
+        eD.setdefault(chainId, set()).add(_intern(pfamId))
+    if numSkipped:
+        logger.warning("Skipped %d bad pfam ID records in %s (first: %r)", numSkipped, csvFileName, firstSkipped)
+    logger.info("PFAM data for %d entries", len(tD))
+    return tD
+
+
+def _getInterProChainMapping(siftsSummaryDirPath, csvFileName):
+    """Integrated SIFTS summary instance-level InterPro mapping data."""
+    fp = os.path.join(siftsSummaryDirPath, csvFileName)
+    rowIt = _iterSiftsSummaryFile(fp, columns=["PDB", "CHAIN", "INTERPRO_ID"])
+    tD = {}
+    _intern = sys.intern
+    lastEntryId = eD = None
+    numSkipped = 0
+    firstSkipped = None
+    for entryId, chainId, interProId in rowIt:
+        if not interProId.startswith("IPR"):
+            numSkipped += 1
+            firstSkipped = firstSkipped or (entryId, chainId, interProId)
+            continue
+        if entryId != lastEntryId:
+            eD = tD.setdefault(entryId.upper(), {})
+            lastEntryId = entryId
+        eD.setdefault(chainId, set()).add(_intern(interProId))
+    if numSkipped:
+        logger.warning("Skipped %d bad InterPro ID records in %s (first: %r)", numSkipped, csvFileName, firstSkipped)
+    logger.info("InterPro data for %d entries", len(tD))
+    return tD
+
+
+def _getGoIdChainMapping(siftsSummaryDirPath, csvFileName):
+    """Integrated SIFTS summary instance-level GO mapping data.
+
+    PDB,CHAIN,SP_PRIMARY,WITH_STRING,EVIDENCE,GO_ID
+    101m,A,IPRO,InterPro:IPR000971,IEA,GO:0020037
+    101m,A,IPRO,InterPro:IPR002335,IEA,GO:0015671
+    101m,A,IPRO,InterPro:IPR002335,IEA,GO:0019825
+    101m,A,IPRO,InterPro:IPR002335,IEA,GO:0020037
+    101m,A,IPRO,InterPro:IPR012292,IEA,GO:0019825
+
+    """
+    fp = os.path.join(siftsSummaryDirPath, csvFileName)
+    # read this in list format as the number fields per record is variable.
+    rowLIt = _iterSiftsSummaryFile(fp)
+    # logger.debug("CSV keys: %r", list(rowDL[0].items()))
+    tD = {}
+    _intern = sys.intern
+    lastEntryId = eD = None
+    okCount = 0
+    errCount = 0
+    firstSkipped = None
+    for rowL in rowLIt:
+        entryId = rowL[0]
+        chainId = rowL[1]
+        goId = rowL[-1]
+        if not goId.startswith("GO:"):
+            errCount += 1
+            firstSkipped = firstSkipped or rowL
+            continue
+        if entryId != lastEntryId:
+            eD = tD.setdefault(entryId.upper(), {})
+            lastEntryId = entryId
+        eD.setdefault(chainId, set()).add(_intern(goId))
+        okCount += 1
+
+    logger.info("GO data for %d entries", len(tD))
+    logger.info("GO records %d format errors %d", okCount, errCount)
+    if errCount:
+        logger.warning("Skipped %d bad GO records in %s (first: %r)", errCount, csvFileName, firstSkipped)
+    return tD
+
+
+def _getTaxonomnyChainMapping(siftsSummaryDirPath, csvFileName):
+    """Integrated SIFTS summary instance-level taxonomy mapping data.
+
+    # Taxonomy
+    [('PDB', '101m'), ('CHAIN', 'A'), ('TAX_ID', '9755'), ('SCIENTIFIC_NAME', 'PHYCD')]
+
+    """
+    fp = os.path.join(siftsSummaryDirPath, csvFileName)
+    rowIt = _iterSiftsSummaryFile(fp, columns=["PDB", "CHAIN", "TAX_ID"])
+    tD = {}
+    _intern = sys.intern
+    lastEntryId = eD = None
+    for entryId, chainId, taxId in rowIt:
+        if entryId != lastEntryId:
+            eD = tD.setdefault(entryId.upper(), {})
+            lastEntryId = entryId
+        eD.setdefault(chainId, set()).add(_intern(taxId))
+    #
+    logger.info("Taxonomy for %d entries", len(tD))
+    return tD
+
+
+def _getCathChainMapping(siftsSummaryDirPath, csvFileName):
+    """Integrated SIFTS summary instance-level CATH mapping data."""
+    fp = os.path.join(siftsSummaryDirPath, csvFileName)
+    rowIt = _iterSiftsSummaryFile(fp, columns=["PDB", "CHAIN", "CATH_ID"])
+    tD = {}
+    _intern = sys.intern
+    lastEntryId = eD = None
+    for entryId, chainId, cathId in rowIt:
+        if entryId != lastEntryId:
+            eD = tD.setdefault(entryId.upper(), {})
+            lastEntryId = entryId
+        eD.setdefault(chainId, []).append(_intern(cathId))
+    logger.info("CATH data for %d entries", len(tD))
+    return tD
+
+
+def _getScopChainMapping(siftsSummaryDirPath, csvFileName):
+    """Integrated SIFTS summary instance-level SCOP mapping data."""
+    fp = os.path.join(siftsSummaryDirPath, csvFileName)
+    rowIt = _iterSiftsSummaryFile(fp, columns=["PDB", "CHAIN", "SCOP_ID"])
+    tD = {}
+    _intern = sys.intern
+    lastEntryId = eD = None
+    for entryId, chainId, scopId in rowIt:
+        #
+        if entryId != lastEntryId:
+            eD = tD.setdefault(entryId.upper(), {})
+            lastEntryId = entryId
+        eD.setdefault(chainId, []).append(_intern(scopId))
+    #
+    logger.info("SCOP data for %d entries", len(tD))
+    return tD
+
+
+def _getEnzymeChainMapping(siftsSummaryDirPath, csvFileName):
+    """Integrated SIFTS summary instance-level EC mapping data."""
+    fp = os.path.join(siftsSummaryDirPath, csvFileName)
+    rowIt = _iterSiftsSummaryFile(fp, columns=["PDB", "CHAIN", "EC_NUMBER"])
+    tD = {}
+    _intern = sys.intern
+    lastEntryId = eD = None
+    for entryId, chainId, ecId in rowIt:
+        if entryId != lastEntryId:
+            eD = tD.setdefault(entryId.upper(), {})
+            lastEntryId = entryId
+        eD.setdefault(chainId, []).append(_intern(ecId))
+    logger.info("EC data for %d entries", len(tD))
+    return tD
+
+
+class _SqliteEntryMapping(Mapping):
+    """Read-only {entryId: chain mapping} view of a SIFTS summary cache stored as one pickled record per entry in SQLite.
+
+    Entries are unpickled on access, so only the entries queried are held in memory.  The database connection
+    is opened on first access and may be released with close() (it is reopened if the mapping is used again).
+    """
+
+    def __init__(self, filePath):
+        self.__filePath = filePath
+        self.__con = None
+        self.__lastEntry = (None, None)
+
+    @staticmethod
+    def write(filePath, ssD):
+        """Write the input {entryId: chain mapping} dictionary as a SQLite database file.
+
+        The database is built in a temporary file which then replaces the target file, so a failed
+        write never leaves a partial database in filePath.
+        """
+        tmpPath = filePath + ".tmp"
+        if os.access(tmpPath, os.F_OK):
+            os.remove(tmpPath)
+        try:
+            con = sqlite3.connect(tmpPath)
+            try:
+                with con:
+                    con.execute("CREATE TABLE entries (entry_id TEXT PRIMARY KEY, data BLOB) WITHOUT ROWID")
+                    con.executemany("INSERT INTO entries VALUES (?, ?)", ((entryId, pickle.dumps(eD, pickle.HIGHEST_PROTOCOL)) for entryId, eD in ssD.items()))
+            finally:
+                con.close()
+            os.replace(tmpPath, filePath)
+        except Exception:
+            if os.access(tmpPath, os.F_OK):
+                os.remove(tmpPath)
+            raise
+
+    def __connection(self):
+        if self.__con is None:
+            self.__con = sqlite3.connect(self.__filePath, check_same_thread=False)
+        return self.__con
+
+    def close(self):
+        """Close the database connection (e.g. before the cache file is bundled or replaced)."""
+        if self.__con is not None:
+            self.__con.close()
+            self.__con = None
+        self.__lastEntry = (None, None)
+
+    def __getitem__(self, entryId):
+        if self.__lastEntry[0] == entryId:
+            return self.__lastEntry[1]
+        row = self.__connection().execute("SELECT data FROM entries WHERE entry_id = ?", (entryId,)).fetchone()
+        if row is None:
+            raise KeyError(entryId)
+        eD = pickle.loads(row[0])
+        self.__lastEntry = (entryId, eD)
+        return eD
+
+    def __contains__(self, entryId):
+        return self.__connection().execute("SELECT 1 FROM entries WHERE entry_id = ?", (entryId,)).fetchone() is not None
+
+    def __iter__(self):
+        return (row[0] for row in self.__connection().execute("SELECT entry_id FROM entries").fetchall())
+
+    def __len__(self):
+        return self.__connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
 
 class SiftsSummaryProvider(StashableBase):
     """Utilities to manage access to SIFTS summary mapping data."""
@@ -41,30 +392,45 @@ class SiftsSummaryProvider(StashableBase):
         super(SiftsSummaryProvider, self).__init__(cachePath, [dirName])
 
         self.__ssD = self.__rebuildCache(**kwargs)
+        self.__entryL = None
+        self.__uniqueIdD = {}
+        # bounded (least recently used) memos of the UNPAL alignment dictionaries and the SeqAlign objects built for recently requested chains
+        self.__alignDictD = OrderedDict()
+        self.__seqAlignD = OrderedDict()
+        self.__seqAlignCacheSize = kwargs.get("seqAlignCacheSize", 100000)
 
     def getEntryCount(self):
         return len(self.__ssD)
 
     def getEntries(self):
-        return sorted(self.__ssD.keys())
+        if self.__entryL is None:
+            self.__entryL = sorted(self.__ssD.keys())
+        return list(self.__entryL)
 
     def getUniqueIdentifiers(self, idType="UNPID"):
-        uL = []
-        if idType not in ["UNPAL", "UNPID", "PFAMID", "GOID", "IPROID", "TAXID", "CATHID", "SCOPID", "ECID"]:
-            return uL
-        try:
-            for _, aD in self.__ssD.items():
-                for _, iD in aD.items():
+        if idType not in _ID_TYPES:
+            return []
+        # the summary data is fixed once loaded - collect each identifier type once and reuse it
+        uL = self.__uniqueIdD.get(idType)
+        if uL is None:
+            uL = []
+            for aD in self.__ssD.values():
+                for iD in aD.values():
                     if idType in iD:
                         uL.extend(iD[idType])
-            return sorted(set(uL))
-        except Exception:
-            pass
-        return uL
+            if idType == "UNPAL":
+                uL = _toAlignmentDictList(uL)
+            try:
+                uL = sorted(set(uL))
+            except TypeError:
+                # unhashable alignment records (UNPAL) are returned as collected
+                pass
+            self.__uniqueIdD[idType] = uL
+        return list(uL)
 
     def getEntryUniqueIdentifiers(self, entryIdList, idType="UNPID"):
         uL = []
-        if idType not in ["UNPAL", "UNPID", "PFAMID", "GOID", "IPROID", "TAXID", "CATHID", "SCOPID", "ECID"]:
+        if idType not in _ID_TYPES:
             return uL
         try:
             for entryId in entryIdList:
@@ -73,35 +439,35 @@ class SiftsSummaryProvider(StashableBase):
                     for _, iD in aD.items():
                         if idType in iD:
                             uL.extend(iD[idType])
+            if idType == "UNPAL":
+                uL = _toAlignmentDictList(uL)
             return sorted(set(uL))
         except Exception:
             pass
         return uL
 
     def getAlignmentCount(self, entryId, authAsymId):
-        num = 0
-        try:
-            num = len(self.__ssD[entryId][authAsymId]["UNPAL"])
-        except Exception:
-            pass
-        return num
+        return len(self.getAlignments(entryId, authAsymId))
 
     def getAlignments(self, entryId, authAsymId):
-        aL = []
-        try:
-            aL = self.__ssD[entryId][authAsymId]["UNPAL"]
-        except Exception:
-            pass
-        return aL
+        return self.__getChainValues(entryId, authAsymId, "UNPAL")
 
     def getSeqAlignObjList(self, entryId, authAsymId):
-        saoL = []
-        try:
-            # aL = self.__ssD[entryId][authAsymId]["UNPAL"]
-            saoL = [SeqAlign("SIFTS", **sa) for sa in self.__ssD[entryId][authAsymId]["UNPAL"]]
-        except Exception:
-            pass
-        return saoL
+        # SeqAlign objects are read-only - share those built for recently requested chains across calls
+        key = (entryId, authAsymId)
+        saoT = self.__seqAlignD.get(key)
+        if saoT is None:
+            saoT = ()
+            try:
+                saoT = tuple(SeqAlign("SIFTS", **sa) for sa in self.__getChainValues(entryId, authAsymId, "UNPAL"))
+            except (TypeError, ValueError) as e:
+                logger.debug("Bad SIFTS alignment for %s %s: %s", entryId, authAsymId, str(e))
+            self.__seqAlignD[key] = saoT
+            if len(self.__seqAlignD) > self.__seqAlignCacheSize:
+                self.__seqAlignD.popitem(last=False)
+        else:
+            self.__seqAlignD.move_to_end(key)
+        return list(saoT)
 
     def getLongestAlignments(self, entryId, authAsymIdL):
         """Return the longest unique SIFTS alignments for the input entity instances.
@@ -115,44 +481,45 @@ class SiftsSummaryProvider(StashableBase):
         """
         retD = {}
         seqAlignObjL = []
-        asymMaxAlignLengthD = {}
+        maxAlignLength = 0
         for authAsymId in authAsymIdL:
             #
-            asymMaxAlignLength = asymMaxAlignLengthD.get(entryId, 0)
             asymSeqAlignObjL = self.getSeqAlignObjList(entryId, authAsymId)
-            asaoLength = sum([seqAlignObj.getEntityAlignLength() for seqAlignObj in asymSeqAlignObjL])
+            asaoLength = sum(seqAlignObj.getEntityAlignLength() for seqAlignObj in asymSeqAlignObjL)
             logger.debug("asaoLength %r for list: %r", asaoLength, asymSeqAlignObjL)
             #
             # accumulate only the longest sifts alignments by entity.
             # Only keep the chain with the longest alignment
-            if asaoLength > asymMaxAlignLength:
-                seqAlignObjL = [sa for sa in asymSeqAlignObjL]
+            if asaoLength > maxAlignLength:
+                seqAlignObjL = asymSeqAlignObjL
                 logger.debug("siftsAlignD: %r", seqAlignObjL)
-                asymMaxAlignLengthD[entryId] = asaoLength
+                maxAlignLength = asaoLength
         #
         for seqAlignObj in seqAlignObjL:
             retD.setdefault((seqAlignObj.getDbName(), seqAlignObj.getDbAccession()), []).append(seqAlignObj)
         return retD
 
     def getIdentifiers(self, entryId, authAsymId, idType=None):
-        aL = []
-        try:
-            if idType in ["UNPAL", "UNPID", "PFAMID", "GOID", "IPROID", "TAXID", "CATHID", "SCOPID", "ECID"]:
-                aL = self.__ssD[entryId][authAsymId][idType]
-                logger.debug("sifts returns entryId %r authasymid %r idtype %r result %r", entryId, authAsymId, idType, aL)
-            else:
-                logger.error("Unsupported SIFTS idType %r", idType)
-        except Exception as e:
-            logger.debug("Failing with %s", str(e))
-        return aL
+        if idType not in _ID_TYPES:
+            logger.error("Unsupported SIFTS idType %r", idType)
+            return []
+        return self.__getChainValues(entryId, authAsymId, idType)
 
     def getTaxIds(self, entryId, authAsymId):
-        tL = []
-        try:
-            tL = self.__ssD[entryId][authAsymId]["TAXID"]
-        except Exception:
-            pass
-        return tL
+        return self.__getChainValues(entryId, authAsymId, "TAXID")
+
+    def close(self):
+        """Release any open handle on the cache file (the SQLite connection of a "sqlite" format cache)."""
+        if isinstance(self.__ssD, _SqliteEntryMapping):
+            self.__ssD.close()
+
+    def backup(self, cfgOb, configName, remotePrefix=None, useStash=True, useGit=False, backupToFallback=False):
+        self.close()
+        return super(SiftsSummaryProvider, self).backup(cfgOb, configName, remotePrefix=remotePrefix, useStash=useStash, useGit=useGit, backupToFallback=backupToFallback)
+
+    def restore(self, cfgOb, configName, remotePrefix=None, useStash=True, useGit=False):
+        self.close()
+        return super(SiftsSummaryProvider, self).restore(cfgOb, configName, remotePrefix=remotePrefix, useStash=useStash, useGit=useGit)
 
     def testCache(self):
         logger.info("SIFTS entry length %d", self.getEntryCount())
@@ -160,311 +527,147 @@ class SiftsSummaryProvider(StashableBase):
             return True
         return False
 
+    def __getChainValues(self, entryId, authAsymId, idType):
+        if idType == "UNPAL":
+            return self.__getAlignmentDictList(entryId, authAsymId)
+        chainD = self.__ssD.get(entryId, {}).get(authAsymId)
+        return chainD.get(idType, []) if chainD else []
+
+    def __getAlignmentDictList(self, entryId, authAsymId):
+        """Return the UNPAL records of the input chain as dictionaries (the stored tuples are expanded once per recently requested chain)."""
+        key = (entryId, authAsymId)
+        aL = self.__alignDictD.get(key)
+        if aL is None:
+            chainD = self.__ssD.get(entryId, {}).get(authAsymId)
+            aL = _toAlignmentDictList(chainD.get("UNPAL", [])) if chainD else []
+            self.__alignDictD[key] = aL
+            if len(self.__alignDictD) > self.__seqAlignCacheSize:
+                self.__alignDictD.popitem(last=False)
+        else:
+            self.__alignDictD.move_to_end(key)
+        return aL
+
     def __rebuildCache(self, **kwargs):
         mU = MarshalUtil()
         # source directory path
         srcDirPath = kwargs.get("srcDirPath", None)
-        # cache details
+        # cache details - "orjson-zstd" (zstd-compressed orjson) is a smaller and faster loading opt-in alternative to pickle
         cacheKwargs = kwargs.get("cacheKwargs", {"fmt": "pickle"})
+        if cacheKwargs["fmt"] == "orjson-zstd" and not (orjson and zstandard):
+            raise ImportError("SIFTS summary cache format 'orjson-zstd' requires the orjson and zstandard packages")
         useCache = kwargs.get("useCache", True)
         entrySaveLimit = kwargs.get("entrySaveLimit", None)
         abbreviated = str(kwargs.get("abbreviated", "TEST")).upper()
+        # number of worker processes used to parse the SIFTS source files when rebuilding the cache
+        # (workers are spawned, so a calling script must guard its entry point with `if __name__ == "__main__":`)
+        numProc = kwargs.get("numProc", 1)
         #
         # cacheDirPath = kwargs.get("cacheDirPath", None)
         cacheDirPath = self.__cacheDirPath
         pyVersion = sys.version_info[0]
-        ext = "pic" if cacheKwargs["fmt"] == "pickle" else "json"
-        saveFilePath = os.path.join(cacheDirPath, "sifts-summary-py%s.%s" % (str(pyVersion), ext))
+        extD = {"pickle": "pic", "orjson-zstd": "json.zst", "sqlite": "db"}
+        saveFilePath = os.path.join(cacheDirPath, "sifts-summary-py%s.%s" % (str(pyVersion), extD.get(cacheKwargs["fmt"], "json")))
+        # a cache saved (or restored from a stash) in another format that can be read here is converted when the requested one is absent
+        altFmtL = [fmt for fmt in ["pickle", "orjson-zstd", "sqlite"] if fmt != cacheKwargs["fmt"] and (fmt != "orjson-zstd" or (orjson and zstandard))]
+        altFilePathD = {fmt: os.path.join(cacheDirPath, "sifts-summary-py%s.%s" % (str(pyVersion), extD[fmt])) for fmt in altFmtL}
+        altFmt = next((fmt for fmt in altFmtL if os.access(altFilePathD[fmt], os.R_OK)), None)
         #
         ssD = {}
         try:
             if useCache and os.access(saveFilePath, os.R_OK):
-                ssD = mU.doImport(saveFilePath, **cacheKwargs)
+                ssD = self.__importCache(mU, saveFilePath, cacheKwargs)
+            elif useCache and altFmt:
+                logger.warning("Converting SIFTS summary cache %s (%s format) to the requested %s format", altFilePathD[altFmt], altFmt, cacheKwargs["fmt"])
+                altD = self.__importCache(mU, altFilePathD[altFmt], {"fmt": altFmt})
+                if isinstance(altD, _SqliteEntryMapping):
+                    ssD = dict(altD.items())
+                    altD.close()
+                else:
+                    ssD = altD
+                ok = self.__exportCache(mU, saveFilePath, ssD, cacheKwargs)
+                logger.info("Saving SIFTS summary serialized data file %s (%d) status %r", saveFilePath, len(ssD), ok)
+                if cacheKwargs["fmt"] == "sqlite":
+                    ssD = self.__importCache(mU, saveFilePath, cacheKwargs)
             else:
                 if not srcDirPath:
                     logger.error("Missing SIFTS source path details")
                     return ssD
-                ssD = self.__getSummaryMapping(srcDirPath, abbreviated=abbreviated)
+                ssD = self.__getSummaryMapping(srcDirPath, abbreviated=abbreviated, numProc=numProc)
                 if entrySaveLimit:
                     ssD = {k: ssD[k] for k in list(ssD.keys())[:entrySaveLimit]}
                 mU.mkdir(cacheDirPath)
-                ok = mU.doExport(saveFilePath, ssD, **cacheKwargs)
+                ok = self.__exportCache(mU, saveFilePath, ssD, cacheKwargs)
                 logger.debug("Saving SIFTS summary serialized data file %s (%d) status %r", saveFilePath, len(ssD), ok)
         except Exception as e:
             logger.exception("Failing with %s", str(e))
         return ssD
 
-    def __getSummaryMapping(self, siftsSummaryDirPath, abbreviated="PROD"):
-        """ """
-
-        uSeqD = self.__getUniprotChainMapping(siftsSummaryDirPath, "pdb_chain_uniprot.csv.gz")
-        # _, uSeqD = self.__getUniprotChainMapping(siftsSummaryDirPath, "uniprot_segments_observed.csv.gz")
-        logger.debug("uSeqD %d", len(uSeqD))
-        for entryId, eD in uSeqD.items():
-            for chainId, _ in eD.items():
-                uSeqD[entryId][chainId]["UNPID"] = (
-                    sorted(set(uSeqD[entryId][chainId]["UNPID"])) if ((entryId in uSeqD) and (chainId in uSeqD[entryId]) and ("UNPID" in uSeqD[entryId][chainId])) else []
-                )
-
-        #
-        #
-        tD = self.__getPfamChainMapping(siftsSummaryDirPath, "pdb_chain_pfam.csv.gz")
-        logger.info("SIFTS PFAM mapping length %d", len(tD))
-        for entryId, eD in uSeqD.items():
-            for chainId, _ in eD.items():
-                uSeqD[entryId][chainId]["PFAMID"] = sorted(set(tD[entryId][chainId])) if entryId in tD and chainId in tD[entryId] else []
-        #
-        if abbreviated == "TEST":
-            return uSeqD
-        #
-        tD = self.__getInterProChainMapping(siftsSummaryDirPath, "pdb_chain_interpro.csv.gz")
-        logger.info("SIFTS InterPro mapping length %d", len(tD))
-        #
-        for entryId, eD in uSeqD.items():
-            for chainId, _ in eD.items():
-                uSeqD[entryId][chainId]["IPROID"] = sorted(set(tD[entryId][chainId])) if entryId in tD and chainId in tD[entryId] else []
-
-        #
-        tD = self.__getGoIdChainMapping(siftsSummaryDirPath, "pdb_chain_go.csv.gz")
-        logger.info("SIFTS GO mapping length %d", len(tD))
-        #
-        for entryId, eD in uSeqD.items():
-            for chainId, _ in eD.items():
-                uSeqD[entryId][chainId]["GOID"] = sorted(set(tD[entryId][chainId])) if entryId in tD and chainId in tD[entryId] else []
-        #
-        if abbreviated == "PROD":
-            return uSeqD
-        # --------------------
-        tD = self.__getTaxonomnyChainMapping(siftsSummaryDirPath, "pdb_chain_taxonomy.csv.gz")
-        logger.info("SIFTS Taxonomy mapping length %d", len(tD))
-        for entryId, eD in uSeqD.items():
-            for chainId, _ in eD.items():
-                uSeqD[entryId][chainId]["TAXID"] = sorted(list(tD[entryId][chainId].keys())) if entryId in tD and chainId in tD[entryId] else []
+    def __importCache(self, mU, filePath, cacheKwargs):
+        if cacheKwargs["fmt"] == "sqlite":
+            return _SqliteEntryMapping(filePath)
+        if cacheKwargs["fmt"] == "orjson-zstd":
+            with open(filePath, "rb") as ifh:
+                return orjson.loads(zstandard.ZstdDecompressor().decompress(ifh.read()))
+        return mU.doImport(filePath, **cacheKwargs)
+
+    def __exportCache(self, mU, filePath, ssD, cacheKwargs):
+        if cacheKwargs["fmt"] == "sqlite":
+            _SqliteEntryMapping.write(filePath, ssD)
+            return True
+        if cacheKwargs["fmt"] == "orjson-zstd":
+            with open(filePath, "wb") as ofh:
+                ofh.write(zstandard.ZstdCompressor(level=cacheKwargs.get("level", 9)).compress(orjson.dumps(ssD)))
+            return True
+        if cacheKwargs["fmt"] == "pickle":
+            return mU.doExport(filePath, ssD, **dict({"pickleProtocol": pickle.HIGHEST_PROTOCOL}, **cacheKwargs))
+        return mU.doExport(filePath, ssD, **cacheKwargs)
+
+    def __getSummaryMapping(self, siftsSummaryDirPath, abbreviated="PROD", numProc=1):
+        """Read and merge the SIFTS chain mapping files (in numProc worker processes when numProc > 1)."""
+        # (identifier type, parser, source file, conversion applied to the merged values) for each level of detail
+        mappingL = [("PFAMID", _getPfamChainMapping, "pdb_chain_pfam.csv.gz", sorted)]
+        if abbreviated != "TEST":
+            mappingL.append(("IPROID", _getInterProChainMapping, "pdb_chain_interpro.csv.gz", sorted))
+            mappingL.append(("GOID", _getGoIdChainMapping, "pdb_chain_go.csv.gz", sorted))
+        if abbreviated not in ["TEST", "PROD"]:
+            mappingL.append(("TAXID", _getTaxonomnyChainMapping, "pdb_chain_taxonomy.csv.gz", sorted))
+            mappingL.append(("CATHID", _getCathChainMapping, "pdb_chain_cath_uniprot.csv.gz", None))
+            mappingL.append(("SCOPID", _getScopChainMapping, "pdb_chain_scop_uniprot.csv.gz", None))
+            mappingL.append(("ECID", _getEnzymeChainMapping, "pdb_chain_enzyme.csv.gz", None))
         #
-        tD = self.__getCathChainMapping(siftsSummaryDirPath, "pdb_chain_cath_uniprot.csv.gz")
-        logger.info("SIFTS CATH mappinglength %d", len(tD))
-        for entryId, eD in uSeqD.items():
-            for chainId, _ in eD.items():
-                uSeqD[entryId][chainId]["CATHID"] = tD[entryId][chainId] if entryId in tD and chainId in tD[entryId] else []
-
-        tD = self.__getScopChainMapping(siftsSummaryDirPath, "pdb_chain_scop_uniprot.csv.gz")
-        logger.info("SIFTS SCOP mapping length %d", len(tD))
-        for entryId, eD in uSeqD.items():
-            for chainId, _ in eD.items():
-                uSeqD[entryId][chainId]["SCOPID"] = tD[entryId][chainId] if entryId in tD and chainId in tD[entryId] else []
+        if numProc > 1:
+            # spawned (not forked) workers - forking is unsafe once the polars thread pool is running in this process
+            with ProcessPoolExecutor(max_workers=min(numProc, len(mappingL) + 1), mp_context=multiprocessing.get_context("spawn")) as executor:
+                uSeqFuture = executor.submit(_getUniprotChainMapping, siftsSummaryDirPath, "pdb_chain_uniprot.csv.gz")
+                futureL = [executor.submit(parserFn, siftsSummaryDirPath, fileName) for _, parserFn, fileName, _ in mappingL]
+                uSeqD = uSeqFuture.result()
+                tDL = [future.result() for future in futureL]
+        else:
+            uSeqD = _getUniprotChainMapping(siftsSummaryDirPath, "pdb_chain_uniprot.csv.gz")
+            tDL = [parserFn(siftsSummaryDirPath, fileName) for _, parserFn, fileName, _ in mappingL]
+        # _, uSeqD = _getUniprotChainMapping(siftsSummaryDirPath, "uniprot_segments_observed.csv.gz")
+        logger.debug("uSeqD %d", len(uSeqD))
         #
-
-        tD = self.__getEnzymeChainMapping(siftsSummaryDirPath, "pdb_chain_enzyme.csv.gz")
-        logger.info("SIFTS EC mapping length %d", len(tD))
-        for entryId, eD in uSeqD.items():
-            for chainId, _ in eD.items():
-                uSeqD[entryId][chainId]["ECID"] = tD[entryId][chainId] if entryId in tD and chainId in tD[entryId] else []
+        mergeL = []
+        for (idType, _, _, convertFn), tD in zip(mappingL, tDL):
+            logger.info("SIFTS %s mapping length %d", idType, len(tD))
+            mergeL.append((idType, tD, convertFn))
+        self.__mergeChainMappings(uSeqD, mergeL)
         #
         return uSeqD
 
-    def __getGeneOntologyChainMapping(self, siftsSummaryDirPath, csvFileName):
-        """Integrated SIFTS summary instance-level GO mapping data.
-
-        PDB,CHAIN,SP_PRIMARY,WITH_STRING,EVIDENCE,GO_ID
-        101m,A,IPRO,InterPro:IPR000971,IEA,GO:0020037
-        101m,A,IPRO,InterPro:IPR002335,IEA,GO:0015671
-        101m,A,IPRO,InterPro:IPR002335,IEA,GO:0019825
-        101m,A,IPRO,InterPro:IPR002335,IEA,GO:0020037
-        101m,A,IPRO,InterPro:IPR012292,IEA,GO:0019825
-
-        """
-        fp = os.path.join(siftsSummaryDirPath, csvFileName)
-        rowDL = self.__readSiftsSummaryFile(fp)
-        logger.info("Length of SIFTS summary file %s %d", csvFileName, len(rowDL))
-        logger.debug("CSV keys: %r", list(rowDL[0].items()))
-        tD = {}
-        for rowD in rowDL:
-            entryId = rowD["PDB"]
-            chainId = rowD["CHAIN"]
-            prov = rowD["SP_PRIMARY"]
-            evidenceCode = rowD["EVIDENCE"]
-            goId = rowD["GO_ID"]
-            dD = {"GO_ID": goId, "EV": evidenceCode, "PROV": prov}
-            tD.setdefault(entryId.upper(), {}).setdefault(chainId, []).append(dD)
-        logger.info("GO data for %d entries", len(tD))
-        return tD
-
-    def __getGoIdChainMapping(self, siftsSummaryDirPath, csvFileName):
-        """Integrated SIFTS summary instance-level GO mapping data.
-
-        PDB,CHAIN,SP_PRIMARY,WITH_STRING,EVIDENCE,GO_ID
-        101m,A,IPRO,InterPro:IPR000971,IEA,GO:0020037
-        101m,A,IPRO,InterPro:IPR002335,IEA,GO:0015671
-        101m,A,IPRO,InterPro:IPR002335,IEA,GO:0019825
-        101m,A,IPRO,InterPro:IPR002335,IEA,GO:0020037
-        101m,A,IPRO,InterPro:IPR012292,IEA,GO:0019825
-
-        """
-        fp = os.path.join(siftsSummaryDirPath, csvFileName)
-        # read this in list format as the number fields per record is variable.
-        rowLL = self.__readSiftsSummaryFile(fp, rowFormat="list")
-        logger.info("Length of SIFTS summary file %s %d", csvFileName, len(rowLL))
-        # logger.debug("CSV keys: %r", list(rowDL[0].items()))
-        tD = {}
-        okCount = 0
-        errCount = 0
-        for rowL in rowLL:
-            entryId = rowL[0]
-            chainId = rowL[1]
-            goId = rowL[-1]
-            if not goId.startswith("GO:"):
-                logger.warning("Skipping bad GO record (%d) %s %s %r", len(rowL), entryId, chainId, goId)
-                errCount += 1
-                continue
-            tD.setdefault(entryId.upper(), {}).setdefault(chainId, []).append(goId)
-            okCount += 1
-
-        logger.info("GO data for %d entries", len(tD))
-        logger.info("GO records %d format errors %d", okCount, errCount)
-        return tD
-
-    def __getInterProChainMapping(self, siftsSummaryDirPath, csvFileName):
-        """Integrated SIFTS summary instance-level InterPro mapping data."""
-        fp = os.path.join(siftsSummaryDirPath, csvFileName)
-        rowDL = self.__readSiftsSummaryFile(fp)
-        logger.info("Length of SIFTS summary file %s %d", csvFileName, len(rowDL))
-        logger.debug("CSV keys: %r", list(rowDL[0].items()))
-        tD = {}
-        for rowD in rowDL:
-            entryId = rowD["PDB"]
-            chainId = rowD["CHAIN"]
-            interProId = rowD["INTERPRO_ID"]
-            if not interProId.startswith("IPR"):
-                logger.warning("Skipping bad InterPro ID %s %s %r %r", entryId, chainId, interProId, rowD)
-                continue
-            tD.setdefault(entryId.upper(), {}).setdefault(chainId, []).append(interProId)
-        logger.info("InterPro data for %d entries", len(tD))
-        return tD
-
-    def __getPfamChainMapping(self, siftsSummaryDirPath, csvFileName):
-        """Integrated SIFTS summary instance-level PFAM mapping data."""
-        fp = os.path.join(siftsSummaryDirPath, csvFileName)
-        rowDL = self.__readSiftsSummaryFile(fp)
-        logger.info("Length of SIFTS summary file %s %d", csvFileName, len(rowDL))
-        logger.debug("CSV keys: %r", list(rowDL[0].items()))
-        tD = {}
-        for rowD in rowDL:
-            entryId = rowD["PDB"]
-            chainId = rowD["CHAIN"]
-            pfamId = rowD["PFAM_ID"]
-            if not pfamId.startswith("PF"):
-                logger.warning("Skipping bad pfam ID %s %s %r %r", entryId, chainId, pfamId, rowD)
-                continue
-            tD.setdefault(entryId.upper(), {}).setdefault(chainId, []).append(pfamId)
-        logger.info("PFAM data for %d entries", len(tD))
-        return tD
-
-    def __getEnzymeChainMapping(self, siftsSummaryDirPath, csvFileName):
-        """Integrated SIFTS summary instance-level EC mapping data."""
-        fp = os.path.join(siftsSummaryDirPath, csvFileName)
-        rowDL = self.__readSiftsSummaryFile(fp)
-        logger.info("Length of SIFTS summary file %s %d", csvFileName, len(rowDL))
-        logger.debug("CSV keys: %r", list(rowDL[0].items()))
-        tD = {}
-        for rowD in rowDL:
-            entryId = rowD["PDB"]
-            chainId = rowD["CHAIN"]
-            ecId = rowD["EC_NUMBER"]
-            tD.setdefault(entryId.upper(), {}).setdefault(chainId, []).append(ecId)
-        logger.info("EC data for %d entries", len(tD))
-        return tD
-
-    def __getCathChainMapping(self, siftsSummaryDirPath, csvFileName):
-        """Integrated SIFTS summary instance-level CATH mapping data."""
-        fp = os.path.join(siftsSummaryDirPath, csvFileName)
-        rowDL = self.__readSiftsSummaryFile(fp)
-        logger.info("Length of SIFTS summary file %s %d", csvFileName, len(rowDL))
-        logger.debug("CSV keys: %r", list(rowDL[0].items()))
-        tD = {}
-        for rowD in rowDL:
-            entryId = rowD["PDB"]
-            chainId = rowD["CHAIN"]
-            cathId = rowD["CATH_ID"]
-            tD.setdefault(entryId.upper(), {}).setdefault(chainId, []).append(cathId)
-        logger.info("CATH data for %d entries", len(tD))
-        return tD
-
-    def __getScopChainMapping(self, siftsSummaryDirPath, csvFileName):
-        """Integrated SIFTS summary instance-level SCOP mapping data."""
-        fp = os.path.join(siftsSummaryDirPath, csvFileName)
-        rowDL = self.__readSiftsSummaryFile(fp)
-        logger.info("Length of SIFTS summary file %s %d", csvFileName, len(rowDL))
-        logger.debug("%r", list(rowDL[0].items()))
-        tD = {}
-        for rowD in rowDL:
-            entryId = rowD["PDB"]
-            chainId = rowD["CHAIN"]
-            scopId = rowD["SCOP_ID"]
-            #
-            tD.setdefault(entryId.upper(), {}).setdefault(chainId, []).append(scopId)
-        #
-        logger.info("SCOP data for %d entries", len(tD))
-        return tD
-
-    def __getTaxonomnyChainMapping(self, siftsSummaryDirPath, csvFileName):
-        """Integrated SIFTS summary instance-level taxonomy mapping data.
-
-        # Taxonomy
-        [('PDB', '101m'), ('CHAIN', 'A'), ('TAX_ID', '9755'), ('SCIENTIFIC_NAME', 'PHYCD')]
+    def __mergeChainMappings(self, uSeqD, mergeL):
+        """Set uSeqD[entryId][chainId][idType] from each secondary chain mapping (or [] for chains with no mapping) in a single pass over uSeqD.
 
+        Args:
+            uSeqD (dict): UniProt chain mapping {entryId: {chainId: {idType: [...], ...}}} updated in place
+            mergeL (list): (idType, tD, convertFn) tuples with tD the secondary chain mapping {entryId: {chainId: values}}
+                and convertFn an optional transformation applied to the mapped values
         """
-        fp = os.path.join(siftsSummaryDirPath, csvFileName)
-        rowDL = self.__readSiftsSummaryFile(fp)
-        logger.info("Length of SIFTS summary file %s %d", csvFileName, len(rowDL))
-        logger.debug("%r", list(rowDL[0].items()))
-        tD = {}
-        for rowD in rowDL:
-            entryId = rowD["PDB"]
-            chainId = rowD["CHAIN"]
-            taxId = rowD["TAX_ID"]
-            tD.setdefault(entryId.upper(), {}).setdefault(chainId, {}).update({taxId: True})
-        #
-        logger.info("Taxonomy for %d entries", len(tD))
-        return tD
-
-    def __getUniprotChainMapping(self, siftsSummaryDirPath, csvFileName):
-        """Integrated SIFTS summary instance-level uniprot mapping data."""
-        #
-        #
-        fp = os.path.join(siftsSummaryDirPath, csvFileName)
-        rowDL = self.__readSiftsSummaryFile(fp)
-        logger.info("Length of SIFTS UniProt summary file %s %d", csvFileName, len(rowDL))
-        logger.debug("%r", list(rowDL[0].items()))
-        uD = {}
-        # uIdD = {}
-        for rowD in rowDL:
-            entryId = rowD["PDB"]
-            chainId = rowD["CHAIN"]
-            unpId = rowD["SP_PRIMARY"]
-            #
-            entitySeqBeg = int(rowD["RES_BEG"]) if rowD["RES_BEG"].isdigit() else None
-            entitySeqEnd = int(rowD["RES_END"]) if rowD["RES_END"].isdigit() else None
-            entityLength = entitySeqEnd - entitySeqBeg + 1
-            # authSeqBeg = int(rowD["PDB_BEG"]) if rowD["PDB_BEG"].isdigit() else None
-            # authSeqEnd = int(rowD["PDB_END"]) if rowD["PDB_END"].isdigit() else None
-            unpSeqBeg = int(rowD["SP_BEG"]) if rowD["SP_BEG"].isdigit() else None
-            unpSeqEnd = int(rowD["SP_END"]) if rowD["SP_END"].isdigit() else None
-            # dD = {"UP": unpId, "BG": entitySeqBeg, "ND": entitySeqEnd, "AUBG": authSeqBeg, "AUND": authSeqEnd, "UBG": unpSeqBeg, "UND": unpSeqEnd}
-            # dD = {"UP": unpId, "BG": entitySeqBeg, "UBG": unpSeqBeg, "LEN": entityLength}
-            dD = {"UP": unpId, "BG": entitySeqBeg, "LEN": entityLength, "UBG": unpSeqBeg, "UND": unpSeqEnd}
-            uD.setdefault(entryId.upper(), {}).setdefault(chainId, {}).setdefault("UNPAL", []).append(dD)
-            uD.setdefault(entryId.upper(), {}).setdefault(chainId, {}).setdefault("UNPID", []).append(unpId)
-            #
-        logger.info("UniProt mapping for %d entries", len(uD))
-        # -----
-        return uD
-
-    def __readSiftsSummaryFile(self, filePath, rowFormat="dict"):
-        """Read input SIFTS summary file and return a list of dictionaries."""
-        try:
-            mU = MarshalUtil()
-            cL = mU.doImport(filePath, fmt="csv", rowFormat=rowFormat)
-            logger.debug("Container list %d", len(cL))
-        except Exception as e:
-            logger.exception("Failing with %s", str(e))
-        return cL
+        emptyD = {}
+        for entryId, eD in uSeqD.items():
+            entryMergeL = [(idType, tD.get(entryId, emptyD), convertFn) for idType, tD, convertFn in mergeL]
+            for chainId, chainD in eD.items():
+                for idType, cD, convertFn in entryMergeL:
+                    vL = cD.get(chainId)
+                    chainD[idType] = (convertFn(vL) if convertFn else vL) if vL else []
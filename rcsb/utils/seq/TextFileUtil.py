@@ -0,0 +1,91 @@
+##
+# File:    TextFileUtil.py
+# Date:    16-Oct-2026
+#
+# Updates:
+#
+##
+"""
+Open plain or gzip-compressed text source files for sequential reading.
+
+"""
+
+import gzip
+import io
+import logging
+import os
+import shutil
+import signal
+import subprocess
+
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
+try:
+    from isal import igzip_threaded
+except ImportError:
+    igzip_threaded = None
+
+logger = logging.getLogger(__name__)
+
+
+def openTextFile(filePath):
+    """Open a plain or gzip-compressed (*.gz) text file for reading.
+
+    Gzip input is decompressed with the first available of: rapidgzip (parallel decompression, if installed
+    and more than one CPU is available), python-isal (ISA-L, if installed), a separate "gzip -dc" process,
+    or the standard library gzip module.  Every backend passes read failures to the caller - a missing file
+    raises on open, and a corrupt or truncated file raises while reading or (for the gzip process, whose
+    exit status is checked) when the file is closed.
+
+    Args:
+        filePath (str): input file path
+
+    Returns:
+        (file): text file object (UTF-8 with any byte order mark removed and undecodable bytes ignored)
+
+    Raises:
+        (OSError, EOFError): missing, unreadable, corrupt or truncated input
+    """
+    if filePath[-3:] != ".gz":
+        return io.open(filePath, "r", encoding="utf-8-sig", errors="ignore", buffering=1 << 20)
+    numProc = os.cpu_count() or 1
+    if rapidgzip is not None and numProc > 1:
+        return io.TextIOWrapper(rapidgzip.open(filePath, parallelization=numProc), encoding="utf-8-sig", errors="ignore")
+    if igzip_threaded is not None:
+        # Inflate in a background thread when a second core is available (threads=0 inflates inline)
+        return igzip_threaded.open(filePath, "rt", encoding="utf-8-sig", errors="ignore", threads=1 if numProc > 1 else 0, block_size=2 * 1024 * 1024)
+    gzipPath = shutil.which("gzip")
+    if gzipPath:
+        return _GzipProcessReader(gzipPath, filePath)
+    return gzip.open(filePath, "rt", encoding="utf-8-sig", errors="ignore")
+
+
+class _GzipProcessReader(io.TextIOWrapper):
+    """Text reader over the output of a "gzip -dc" process (decompression runs concurrently with parsing).
+
+    close() waits for the process and raises IOError if it failed (e.g. for truncated or corrupt input).
+    """
+
+    def __init__(self, gzipPath, filePath):
+        with open(filePath, "rb") as ifh:
+            self.__proc = subprocess.Popen([gzipPath, "-dc"], stdin=ifh, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1 << 20)
+        super(_GzipProcessReader, self).__init__(self.__proc.stdout, encoding="utf-8-sig", errors="ignore")
+        self.__filePath = filePath
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super(_GzipProcessReader, self).close()
+        finally:
+            retCode = self.__proc.wait()
+            errText = self.__proc.stderr.read().decode("utf-8", errors="ignore").strip()
+            self.__proc.stderr.close()
+        # exit status 2 is a warning (e.g. trailing zero padding) and SIGPIPE follows a close before the end of the output
+        if retCode == 2:
+            logger.warning("Decompressing %r: %s", self.__filePath, errText)
+        elif retCode not in (0, -signal.SIGPIPE):
+            raise IOError("Decompressing %r failed with gzip exit status %r: %s" % (self.__filePath, retCode, errText))
@@ -7,7 +7,10 @@
 ##
 
 import logging
+import operator
 import os
+import pickle
+import sys
 import time
 
 from rcsb.utils.io.FileUtil import FileUtil
@@ -15,6 +18,7 @@ from rcsb.utils.io.IoUtil import IoUtil
 from rcsb.utils.io.MarshalUtil import MarshalUtil
 from rcsb.utils.io.SingletonClass import SingletonClass
 from rcsb.utils.io.StashUtil import StashUtil
+from rcsb.utils.seq.TextFileUtil import openTextFile
 
 logger = logging.getLogger(__name__)
 
@@ -199,8 +203,9 @@ class UniProtIdMappingProvider(SingletonClass):
                     tL = next(it, [])
                     nL = tL[1:]
                     if len(nL) == 1:
+                        # Single mapped values (e.g. taxonomy ids) repeat heavily across accessions - share one string each
                         for row in it:
-                            oD[row[0]] = row[1]
+                            oD[row[0]] = sys.intern(row[1])
                     else:
                         for row in it:
                             oD[row[0]] = row[1:]
@@ -216,17 +221,17 @@ class UniProtIdMappingProvider(SingletonClass):
                 else:
                     logger.info("Using cached mapping file %r", idPath)
                 # ---
-                ioU = IoUtil()
+                idxL = [0]
+                idxL.extend([self.__mapRecordD[mapName] - 1 for mapName in mapNameL])
                 if fmt in ["pickle", "json"]:
                     if len(mapNameL) == 1:
-                        for row in ioU.deserializeCsvIter(idPath, delimiter="\t", rowFormat="list", encodingErrors="ignore"):
-                            oD[row[0]] = str(row[self.__mapRecordD[mapNameL[0]] - 1])
+                        for unpId, mId in self.__iterMappingRows(idPath, idxL):
+                            oD[unpId] = sys.intern(mId)
                     else:
-                        for row in ioU.deserializeCsvIter(idPath, delimiter="\t", rowFormat="list", encodingErrors="ignore"):
-                            for mapName in mapNameL:
-                                oD.setdefault(row[0], []).append(str(row[self.__mapRecordD[mapName] - 1]))
+                        for row in self.__iterMappingRows(idPath, idxL):
+                            oD.setdefault(row[0], []).extend(row[1:])
                     logger.info("Writing serialized mapping file %r", idMapPath)
-                    ok = mU.doExport(idMapPath, {"idNameList": mapNameL, "uniprotMapD": oD}, fmt=fmt)
+                    ok = mU.doExport(idMapPath, {"idNameList": mapNameL, "uniprotMapD": oD}, fmt=fmt, pickleProtocol=pickle.HIGHEST_PROTOCOL)
                 elif fmt == "tdd":
                     #
                     logger.info("Writing serialized mapping file %r", idMapPath)
@@ -237,16 +242,8 @@ class UniProtIdMappingProvider(SingletonClass):
                     colNameL.extend(mapNameL)
                     with open(idMapPath, "w", encoding="utf-8") as ofh:
                         ofh.write("%s\n" % "\t".join(colNameL))
-                        if len(mapNameL) == 1:
-                            idx = self.__mapRecordD[mapNameL[0]] - 1
-                            for row in ioU.deserializeCsvIter(idPath, delimiter="\t", rowFormat="list", encodingErrors="ignore"):
-                                ofh.write("%s\t%s\n" % (row[0], row[idx]))
-                        else:
-                            idxL = [0]
-                            idxL.extend([self.__mapRecordD[mapName] - 1 for mapName in mapNameL])
-                            for row in ioU.deserializeCsvIter(idPath, delimiter="\t", rowFormat="list", encodingErrors="ignore"):
-                                ofh.write("%s\n" % "\t".join([str(row[idx]) for idx in idxL]))
-                            #
+                        for row in self.__iterMappingRows(idPath, idxL):
+                            ofh.write("%s\n" % "\t".join(row))
                     nL, oD = self.__rebuildCache(targetUrl, mapNameL, outDirPath, rawDirPath, fmt=fmt, useCache=True)
                     ok = True if nL and oD else False
             logger.info("Completed reload (%r) at %s (%.4f seconds)", ok, time.strftime("%Y %m %d %H:%M:%S", time.localtime()), time.time() - startTime)
@@ -255,6 +252,31 @@ class UniProtIdMappingProvider(SingletonClass):
         #
         return nL, oD
 
+    def __iterMappingRows(self, filePath, idxL):
+        """Iterate over the rows of the tab-delimited UniProt id mapping file returning tuples of the values in columns idxL.
+
+        Each line is split only as far as the last selected column (no csv parsing and no full row list).
+
+        Args:
+            filePath (str): id mapping file path (optionally gzip compressed)
+            idxL (list): list of (zero-based) column indices (at least two)
+
+        Yields:
+            (tuple): selected column values
+        """
+        maxSplit = max(idxL) + 1
+        getCols = operator.itemgetter(*idxL)
+        numSkipped = 0
+        with openTextFile(filePath) as ifh:
+            for line in ifh:
+                fields = line.rstrip("\r\n").split("\t", maxSplit)
+                if len(fields) < maxSplit or line.startswith("#"):
+                    numSkipped += 1 if line.strip() else 0
+                    continue
+                yield getCols(fields)
+        if numSkipped:
+            logger.warning("Skipped %d short or comment rows in %s", numSkipped, filePath)
+
     def restore(self, cfgOb, configName):
         ok = False
         try:
@@ -12,9 +12,13 @@ Test cases for operations that fetch glycans and glycoproteins from GlyGen.org -
 
 import logging
 import os
+import shutil
 import time
 import unittest
+from unittest import mock
 
+from rcsb.utils.io.FileUtil import FileUtil
+from rcsb.utils.io.UrlRequestUtil import UrlRequestUtil
 from rcsb.utils.seq import __version__
 from rcsb.utils.seq.GlyGenProvider import GlyGenProvider
 
@@ -83,6 +87,62 @@ class GlyGenProviderTests(unittest.TestCase):
             logger.exception("Failing with %s", str(e))
             self.fail()
 
+    def testGlyGenConditionalFetch(self):
+        """Rebuild the glycoprotein list from mocked primary (200/304) and fallback sources"""
+        cachePath = os.path.join(self.__workPath, "CACHE-GLYGEN-FETCH")
+        shutil.rmtree(cachePath, ignore_errors=True)
+        humanFn = "human_protein_masterlist.csv"
+        sourceD = {"release-notes.txt": "v-2.2.1 release notes", "glycan_masterlist.csv": "glytoucan_ac,x\nG00001MO,x\n", humanFn: "uniprotkb_canonical_ac\nP00001-1\n"}
+        requestL = []
+
+        def fakeGet(url, endPoint, paramD, **kwargs):
+            _ = url, paramD
+            ifModifiedSince = dict(kwargs.get("headers", [])).get("If-Modified-Since")
+            requestL.append((endPoint, ifModifiedSince))
+            content = sourceD.get(endPoint, "uniprotkb_canonical_ac\nP00000-1\n") if endPoint in sourceD or endPoint.endswith("_protein_masterlist.csv") else None
+            if content is None:
+                raise IOError("Unavailable %r" % endPoint)
+            # the mocked primary source is unchanged for every conditional request
+            return (None, 304) if ifModifiedSince else (content, 200)
+
+        def fakeFileGet(remote, local):
+            with open(local, "w", encoding="utf-8") as ofh:
+                ofh.write("uniprotkb_canonical_ac\nP00002-3\n")
+            logger.debug("Fallback fetch %r", remote)
+            return True
+
+        def rebuild(**kwargs):
+            del requestL[:]
+            ggP = GlyGenProvider(cachePath=cachePath, useCache=False, glygenBasetUrl="https://primary.invalid/", glygenFallbackUrl="https://fallback.invalid/", **kwargs)
+            return ggP.getGlycoproteins(), dict(requestL)
+
+        humanLastModPath = os.path.join(cachePath, "glygen", humanFn + ".last-modified")
+        with mock.patch.object(UrlRequestUtil, "get", side_effect=fakeGet), mock.patch.object(FileUtil, "get", side_effect=fakeFileGet):
+            # primary download - only primary downloads are recorded for revalidation
+            gD, reqD = rebuild(useConditional=True)
+            self.assertEqual(gD, {"P00000": "1", "P00001": "1"})
+            self.assertFalse(any(reqD.values()))
+            self.assertTrue(os.path.exists(humanLastModPath))
+            # revalidation (304) reuses and reparses the retained source files - the human file falls back
+            sourceD[humanFn] = None
+            gD, reqD = rebuild(useConditional=True)
+            self.assertTrue(reqD[humanFn])
+            self.assertEqual(gD, {"P00000": "1", "P00002": "3"})
+            self.assertFalse(os.path.exists(humanLastModPath))
+            # a file from the fallback source is fetched unconditionally from the recovered primary source
+            sourceD[humanFn] = "uniprotkb_canonical_ac\nP00001-2\n"
+            gD, reqD = rebuild(useConditional=True)
+            self.assertIsNone(reqD[humanFn])
+            self.assertEqual(gD, {"P00000": "1", "P00001": "2"})
+            # conditional requests are opt-in
+            gD, reqD = rebuild()
+            self.assertFalse(any(reqD.values()))
+            self.assertEqual(gD, {"P00000": "1", "P00001": "2"})
+            ggP = GlyGenProvider(cachePath=cachePath, useCache=True)
+            self.assertEqual(ggP.getGlycoproteins(), gD)
+            self.assertEqual(ggP.getVersion(), "2.2.1")
+        shutil.rmtree(cachePath, ignore_errors=True)
+
 
 def readGlyGenData():
     suiteSelect = unittest.TestSuite()
@@ -19,6 +19,7 @@ __license__ = "Apache 2.0"
 
 import logging
 import os
+import shutil
 import time
 import unittest
 
@@ -31,6 +32,26 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s]-%(mo
 logger = logging.getLogger()
 
 
+def _readParentsReference(filePath):
+    """Reference copy of the original ParentChildTreeFile.txt parser (depth from the "--" split)."""
+    interProParentD = {}
+    stack = []
+    with open(filePath, "r", encoding="utf-8") as ifh:
+        for line in ifh:
+            content = line.rstrip()
+            row = content.split("--")
+            ff = row[-1].split("::")
+            tS = ff[0].strip()
+            stack[:] = stack[: len(row) - 1] + [tS]
+            for ii, idCode in enumerate(stack):
+                if idCode not in interProParentD:
+                    interProParentD[idCode] = None if ii == 0 else stack[ii - 1]
+                else:
+                    if interProParentD[idCode] is None and ii != 0:
+                        interProParentD[idCode] = stack[ii - 1]
+    return interProParentD
+
+
 class InterProProviderTests(unittest.TestCase):
     def setUp(self):
         self.__dirPath = os.path.join(os.path.dirname(TOPDIR), "rcsb", "mock-data")
@@ -89,11 +110,85 @@ class InterProProviderTests(unittest.TestCase):
         logger.debug("lin %r", linL)
         self.assertEqual(len(linL), 4)
 
+    def testInterProParentsOffline(self):
+        """Test the parent/child parser and lineage index on local hierarchy files (including a cycle)."""
+        workPath = os.path.join(HERE, "test-output", "interpro-offline")
+        shutil.rmtree(workPath, ignore_errors=True)
+        os.makedirs(workPath)
+        entryPath = os.path.join(workPath, "entry-offline.list")
+        with open(entryPath, "w", encoding="utf-8") as ofh:
+            for ii, tS in enumerate(["Root one", "Child A", "Grandchild", "Great grandchild", "Child B -- dashed", "Root two", "Cycle A", "Cycle B", "Not in tree"], 1):
+                ofh.write("IPR%06d\tFamily\t%s\n" % (ii, tS))
+        treeL = [
+            "IPR000001::Root one::",
+            "--IPR000002::Child A::",
+            "----IPR000003::Grandchild::",
+            "------IPR000004::Great grandchild::",
+            "--IPR000005::Child B -- dashed::",
+            "IPR000006::Root two::",
+            "--IPR000003::Grandchild::",
+            "----IPR000004::Great grandchild::",
+            "IPR000007::Cycle A::",
+            "--IPR000008::Cycle B::",
+            "IPR000008::Cycle B::",
+            "--IPR000007::Cycle A::",
+        ]
+        treePath = os.path.join(workPath, "tree-offline.txt")
+        with open(treePath, "w", encoding="utf-8") as ofh:
+            ofh.write("\n".join(treeL) + "\n")
+        ipP = InterProProvider(urlTargetInterPro=entryPath, urlTargetInterProParent=treePath, cachePath=os.path.join(workPath, "cache-fixture"), useCache=False, useFallBack=False)
+        # a node listed again under another root keeps its first parent, and a "--" inside a name does not change the depth
+        expectedD = {1: None, 2: 1, 3: 2, 4: 3, 5: 1, 6: None, 7: 8, 8: 7, 9: None}
+        for ii, jj in expectedD.items():
+            self.assertEqual(ipP.getParentId("IPR%06d" % ii), "IPR%06d" % jj if jj else None)
+        self.assertEqual(ipP.getLineage("IPR000004"), ["IPR000001", "IPR000002", "IPR000003", "IPR000004"])
+        self.assertEqual(ipP.getLineage("IPR000006"), ["IPR000006"])
+        self.assertEqual(ipP.getLineage("IPR000009"), ["IPR000009"])
+        # the lineage of a node in a parent cycle terminates without repeating a node
+        for idCode in ["IPR000007", "IPR000008"]:
+            linL = ipP.getLineage(idCode)
+            self.assertEqual(linL[-1], idCode)
+            self.assertEqual(len(linL), len(set(linL)))
+        tD = {dD["id"]: dD for dD in ipP.getTreeNodeList()}
+        self.assertEqual(len(tD), 9)
+        self.assertEqual(tD["IPR000001"], {"id": "IPR000001", "name": "Root one", "depth": 0})
+        self.assertEqual(tD["IPR000004"], {"id": "IPR000004", "name": "Great grandchild", "parents": ["IPR000003"], "depth": 3})
+        self.assertEqual(tD["IPR000005"], {"id": "IPR000005", "name": "Child B -- dashed", "parents": ["IPR000001"], "depth": 1})
+        self.assertEqual(tD["IPR000009"]["depth"], 0)
+        self.assertEqual(tD["IPR000007"]["parents"], ["IPR000008"])
+        self.assertEqual(tD["IPR000007"]["depth"], len(ipP.getLineage("IPR000007")) - 1)
+        self.assertEqual(list(ipP.getTreeNodeList(filterD={"IPR000002": True})), [{"id": "IPR000002", "name": "Child A", "parents": ["IPR000001"], "depth": 1}])
+        #
+        # The original parser takes the depth from splitting the whole line on "--", so it only agrees with the new parser
+        # when no name contains "--" - compare both on copies with those names rewritten, and the new parser on both versions
+        for srcPath, srcEntryPath in [(treePath, entryPath), (os.path.join(HERE, "test-data", "ParentChildTreeFile.txt"), os.path.join(HERE, "test-data", "entry.list"))]:
+            cleanPath = os.path.join(workPath, "clean-" + os.path.basename(srcPath))
+            with open(srcPath, "r", encoding="utf-8") as ifh, open(cleanPath, "w", encoding="utf-8") as ofh:
+                for line in ifh:
+                    ff = line.split("::", 1)
+                    ofh.write(ff[0] + ("::" + ff[1].replace("--", "-") if len(ff) > 1 else ""))
+            refD = _readParentsReference(cleanPath)
+            self.assertGreaterEqual(len(refD), 8)
+            for tPath in [srcPath, cleanPath]:
+                cachePath = os.path.join(workPath, "cache-" + os.path.basename(tPath))
+                ipP = InterProProvider(urlTargetInterPro=srcEntryPath, urlTargetInterProParent=tPath, cachePath=cachePath, useCache=False, useFallBack=False)
+                for idCode, parentId in refD.items():
+                    self.assertEqual(ipP.getParentId(idCode), parentId)
+            if srcPath != treePath:
+                # the original lineage walk (no cycles in the released hierarchy)
+                for idCode in refD:
+                    linL = [idCode]
+                    while refD.get(linL[-1]) is not None:
+                        linL.append(refD[linL[-1]])
+                    self.assertEqual(ipP.getLineage(idCode), linL[::-1])
+        shutil.rmtree(workPath, ignore_errors=True)
+
 
 def interProCacheSuite():
     suiteSelect = unittest.TestSuite()
     suiteSelect.addTest(InterProProviderTests("testInterProCache"))
     suiteSelect.addTest(InterProProviderTests("testInterProCacheFallBack"))
+    suiteSelect.addTest(InterProProviderTests("testInterProParentsOffline"))
     return suiteSelect
 
 
@@ -17,13 +17,24 @@ __author__ = "John Westbrook"
 __email__ = "jwest@rcsb.rutgers.edu"
 __license__ = "Apache 2.0"
 
+import gzip
+import io
+import json
 import logging
 import os
+import shutil
 import time
 import unittest
+from unittest import mock
+from urllib.error import HTTPError
 
 from rcsb.utils.seq.PfamProvider import PfamProvider
 
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
 HERE = os.path.abspath(os.path.dirname(__file__))
 TOPDIR = os.path.dirname(os.path.dirname(HERE))
 
@@ -70,6 +81,175 @@ class PfamProviderTests(unittest.TestCase):
         logger.debug("mL (%d)", len(mL))
         self.assertGreaterEqual(len(mL), 2)
 
+    @unittest.skipIf(rapidgzip is None, "rapidgzip is not installed")
+    def testPfamCacheRapidgzip(self):
+        srcDirPath = os.path.join(self.__cachePath, "pfam-rapidgzip-src")
+        os.makedirs(srcDirPath, exist_ok=True)
+        pfamPath = os.path.join(srcDirPath, "Pfam-A.clans.tsv.gz")
+        with gzip.open(pfamPath, "wt") as ofh:
+            for ii in range(1, 2001):
+                ofh.write("PF%05d\tCL%04d\tClan%d\tFam%d\tFamily description %d\n" % (ii, ii % 100, ii % 100, ii, ii))
+        mapPath = os.path.join(srcDirPath, "pdb_pfam_mapping.tsv.gz")
+        with gzip.open(mapPath, "wt") as ofh:
+            ofh.write("# test mapping\n")
+            ofh.write("PDB\tCHAIN\tUNIPROT_ACCESSION\tPFAM_ACCESSION\tAUTH_PDBRES_START\tAUTH_PDBRES_START_INS_CODE\tAUTH_PDBRES_END\tAUTH_PDBRES_END_INS_CODE\n")
+            for ii in range(1, 2001):
+                ofh.write("%dabc\tA\tP%05d\tPF%05d\t1\t\t%d\tNone\n" % (ii % 9, ii, ii, 10 + ii))
+        resL = []
+        # the rapidgzip path is taken only when more than one CPU is reported
+        with mock.patch("os.cpu_count", return_value=4):
+            for useRapidgzip in (True, False):
+                with mock.patch.object(rapidgzip, "open", wraps=rapidgzip.open) as mockOpen, mock.patch("rcsb.utils.seq.TextFileUtil.rapidgzip", rapidgzip if useRapidgzip else None):
+                    pP = PfamProvider(urlTargetPfam=pfamPath, urlTargetMapPfam=mapPath, cachePath=os.path.join(self.__cachePath, "pfam-rapidgzip"), useCache=False)
+                    self.assertEqual(mockOpen.called, useRapidgzip)
+                resL.append(([pP.getDescription("PF%05d" % ii) for ii in (1, 1000, 2000)], [pP.getMapping("%dABC" % ii) for ii in range(9)]))
+        self.assertEqual(resL[0][0][1], "Family description 1000 (Fam1000)")
+        self.assertGreaterEqual(len(resL[0][1][1]), 200)
+        self.assertEqual(resL[0], resL[1])
+
+    def testPfamConditionalFetch(self):
+        """Rebuild the Pfam caches from a mocked primary source (200/304) and a local fallback source"""
+        cachePath = os.path.join(self.__cachePath, "CACHE-PFAM-FETCH")
+        srcDirPath = os.path.join(self.__cachePath, "pfam-fetch-src")
+        shutil.rmtree(cachePath, ignore_errors=True)
+        os.makedirs(srcDirPath, exist_ok=True)
+        mapText = "PDB\tCHAIN\tPFAM_ACCESSION\tAUTH_PDBRES_START\tAUTH_PDBRES_START_INS_CODE\tAUTH_PDBRES_END\tAUTH_PDBRES_END_INS_CODE\n1abc\tA\tPF00001\t1\t\t50\tNone\n"
+        primaryD = {
+            "Pfam-A.clans.tsv.gz": gzip.compress(b"PF00001\tCL0001\tClan1\tFam1\tPrimary description\n"),
+            "pdb_pfam_mapping.tsv.gz": gzip.compress(mapText.encode("utf-8")),
+        }
+        fallbackUrlD = {}
+        for fileName, text in [("Pfam-A.clans.tsv.gz", "PF00001\tCL0001\tClan1\tFam1\tFallback description\n"), ("pdb_pfam_mapping.tsv.gz", mapText)]:
+            fallbackUrlD[fileName] = os.path.join(srcDirPath, fileName)
+            with gzip.open(fallbackUrlD[fileName], "wt") as ofh:
+                ofh.write(text)
+        requestL = []
+        availableL = [True]
+
+        class _Response(io.BytesIO):
+            def __init__(self, data, headers):
+                super(_Response, self).__init__(data)
+                self.headers = headers
+
+        def fakeUrlopen(req, timeout=None):
+            _ = timeout
+            fileName = req.full_url.split("/")[-1]
+            etag = '"%s"' % fileName
+            requestL.append((fileName, req.get_header("If-none-match"), req.get_header("If-modified-since")))
+            if not availableL[0]:
+                raise HTTPError(req.full_url, 503, "Service Unavailable", {}, None)
+            # the mocked primary source is unchanged for every conditional request
+            if req.get_header("If-none-match") == etag:
+                raise HTTPError(req.full_url, 304, "Not Modified", {}, None)
+            return _Response(primaryD[fileName], {"ETag": etag})
+
+        def rebuild():
+            del requestL[:]
+            pP = PfamProvider(
+                cachePath=cachePath,
+                useCache=False,
+                useConditional=True,
+                urlTargetPfam="https://primary.invalid/Pfam-A.clans.tsv.gz",
+                urlTargetMapPfam="https://primary.invalid/pdb_pfam_mapping.tsv.gz",
+                urlTargetPfamFB=fallbackUrlD["Pfam-A.clans.tsv.gz"],
+                urlTargetMapPfamFB=fallbackUrlD["pdb_pfam_mapping.tsv.gz"],
+            )
+            self.assertEqual(len(pP.getMapping("1ABC")), 1)
+            return pP.getDescription("PF00001"), {fileName: (etag, modTime) for fileName, etag, modTime in requestL}
+
+        etagPath = os.path.join(cachePath, "pfam", "Pfam-A.clans.tsv.gz.etag")
+        with mock.patch("rcsb.utils.seq.PfamProvider.urlopen", side_effect=fakeUrlopen):
+            # primary download (200) - the response ETag is recorded
+            descr, reqD = rebuild()
+            self.assertEqual(descr, "Primary description (Fam1)")
+            self.assertEqual(reqD["Pfam-A.clans.tsv.gz"], (None, None))
+            self.assertTrue(os.path.exists(etagPath))
+            # conditional request (304) - the retained primary copy is reused
+            descr, reqD = rebuild()
+            self.assertEqual(descr, "Primary description (Fam1)")
+            self.assertEqual(reqD["Pfam-A.clans.tsv.gz"][0], '"Pfam-A.clans.tsv.gz"')
+            self.assertIsNotNone(reqD["Pfam-A.clans.tsv.gz"][1])
+            # primary failure - the fallback copy replaces the local file and its sidecar is removed
+            availableL[0] = False
+            descr, reqD = rebuild()
+            self.assertEqual(descr, "Fallback description (Fam1)")
+            self.assertFalse(os.path.exists(etagPath))
+            # the fallback copy is not revalidated against the recovered primary source
+            availableL[0] = True
+            descr, reqD = rebuild()
+            self.assertEqual(reqD["Pfam-A.clans.tsv.gz"], (None, None))
+            self.assertEqual(descr, "Primary description (Fam1)")
+        shutil.rmtree(cachePath, ignore_errors=True)
+        shutil.rmtree(srcDirPath, ignore_errors=True)
+
+    def testPfamReadFailure(self):
+        srcDirPath = os.path.join(self.__cachePath, "pfam-bad-src")
+        cachePath = os.path.join(self.__cachePath, "CACHE-PFAM-BAD")
+        shutil.rmtree(cachePath, ignore_errors=True)
+        os.makedirs(srcDirPath, exist_ok=True)
+        pfamPath = os.path.join(srcDirPath, "Pfam-A.clans.tsv.gz")
+        mapPath = os.path.join(srcDirPath, "pdb_pfam_mapping.tsv.gz")
+        with gzip.open(pfamPath, "wt") as ofh:
+            for ii in range(1, 20001):
+                ofh.write("PF%05d\tCL%04d\tClan%d\tFam%d\tFamily description %d %d\n" % (ii, ii % 100, ii % 100, ii, ii, ii * 7919 % 100003))
+        with gzip.open(mapPath, "wt") as ofh:
+            ofh.write("PDB\tCHAIN\tPFAM_ACCESSION\tAUTH_PDBRES_START\tAUTH_PDBRES_START_INS_CODE\tAUTH_PDBRES_END\tAUTH_PDBRES_END_INS_CODE\n")
+            for ii in range(1, 20001):
+                ofh.write("%04d\tA\tPF%05d\t%d\t\t%d\tNone\n" % (ii, ii, ii * 7919 % 1000, ii * 104729 % 10000))
+        for filePath in (pfamPath, mapPath):
+            with open(filePath, "rb") as ifh:
+                data = ifh.read()
+            with open(filePath, "wb") as ofh:
+                ofh.write(data[: len(data) // 2])
+        # truncated primary sources and a missing fallback source produce no (partial) caches
+        missingPath = os.path.join(srcDirPath, "missing.tsv.gz")
+        pP = PfamProvider(cachePath=cachePath, useCache=False, urlTargetPfam=pfamPath, urlTargetPfamFB=missingPath, urlTargetMapPfam=mapPath, urlTargetMapPfamFB=missingPath)
+        self.assertIsNone(pP.getDescription("PF00001"))
+        self.assertEqual(pP.getMapping("0001"), [])
+        self.assertFalse(os.path.exists(os.path.join(cachePath, "pfam", "pfam-data.pic")))
+        self.assertFalse(os.path.exists(os.path.join(cachePath, "pfam", "pfam-mapping-data.pic")))
+        shutil.rmtree(cachePath, ignore_errors=True)
+        shutil.rmtree(srcDirPath, ignore_errors=True)
+
+    def testPfamMappingPackedRoundTrip(self):
+        cachePath = os.path.join(self.__cachePath, "CACHE-PFAM-PACK")
+        srcDirPath = os.path.join(self.__cachePath, "pfam-pack-src")
+        shutil.rmtree(cachePath, ignore_errors=True)
+        os.makedirs(os.path.join(cachePath, "pfam"))
+        os.makedirs(srcDirPath, exist_ok=True)
+        mapD = {
+            "1ABC": [
+                {"pfamId": "PF00001", "authAsymId": "A", "authSeqBeg": 1, "authSeqEnd": 50, "insertBeg": None, "insertEnd": None},
+                {"pfamId": "PF00002", "authAsymId": "A", "authSeqBeg": -5, "authSeqEnd": None, "insertBeg": "A", "insertEnd": None},
+            ],
+            "2XYZ": [{"pfamId": "PF00001", "authAsymId": "BB", "authSeqBeg": None, "authSeqEnd": None, "insertBeg": None, "insertEnd": "Z"}],
+        }
+        # a legacy JSON mapping cache is packed into the columnar format and unpacked by getMapping()
+        with open(os.path.join(cachePath, "pfam", "pfam-mapping-data.json"), "w", encoding="utf-8") as ofh:
+            json.dump(mapD, ofh)
+        pP = PfamProvider(cachePath=cachePath, useCache=True)
+        for pdbId, mapL in mapD.items():
+            self.assertEqual(pP.getMapping(pdbId), mapL)
+            self.assertEqual(pP.getMapping(pdbId.lower()), mapL)
+        self.assertEqual(pP.getMapping("3NONE"), [])
+        self.assertTrue(os.path.exists(os.path.join(cachePath, "pfam", "pfam-mapping-data.pic")))
+        self.assertEqual(PfamProvider(cachePath=cachePath, useCache=True).getMapping("1ABC"), mapD["1ABC"])
+        # the same mapping parsed from source rows - rows with non-numeric residue numbers (or no PDB id) are skipped
+        mapPath = os.path.join(srcDirPath, "pdb_pfam_mapping.tsv.gz")
+        with gzip.open(mapPath, "wt") as ofh:
+            ofh.write("# comment\nPDB\tCHAIN\tPFAM_ACCESSION\tAUTH_PDBRES_START\tAUTH_PDBRES_START_INS_CODE\tAUTH_PDBRES_END\tAUTH_PDBRES_END_INS_CODE\n")
+            ofh.write("1abc\tA\tpf00001\t1\t\t50\tNone\n")
+            ofh.write("1abc\tA\tPF00003\t1x\t\t50\t\n")
+            ofh.write("1abc\tA\tPF00002\t-5\tA\tNone\tNone\n")
+            ofh.write("\tA\tPF00004\t1\t\t5\t\n")
+            ofh.write("2xyz\tbb\tPF00001\t\tNone\tNone\tZ\n")
+        missingPath = os.path.join(srcDirPath, "missing.tsv.gz")
+        pP = PfamProvider(cachePath=cachePath, useCache=False, urlTargetPfam=missingPath, urlTargetPfamFB=missingPath, urlTargetMapPfam=mapPath, urlTargetMapPfamFB=missingPath)
+        for pdbId, mapL in mapD.items():
+            self.assertEqual(pP.getMapping(pdbId), mapL)
+        shutil.rmtree(cachePath, ignore_errors=True)
+        shutil.rmtree(srcDirPath, ignore_errors=True)
+
 
 def pfamCacheSuite():
     suiteSelect = unittest.TestSuite()
@@ -92,6 +92,8 @@ class SeqAlignTests(unittest.TestCase):
             grpD = splitSeqAlignObjList(seqAlignObjL)
             self.assertEqual(len(grpD), 3)
             logger.info("grpD %r", grpD)
+            # overlapping alignments are collected in the same group
+            self.assertEqual(sorted([sorted(sa.getEntitySeqIdBeg() for sa in saL) for saL in grpD.values()]), [[1, 1, 1, 50], [400], [1000]])
         except Exception as e:
             logger.exception("Failing with %s", str(e))
             self.fail()
@@ -17,13 +17,15 @@ __author__ = "John Westbrook"
 __email__ = "jwest@rcsb.rutgers.edu"
 __license__ = "Apache 2.0"
 
+import gzip
 import logging
 import os
 import platform
+import shutil
 import time
 import unittest
 
-from rcsb.utils.seq.SiftsSummaryProvider import SiftsSummaryProvider
+from rcsb.utils.seq.SiftsSummaryProvider import SiftsSummaryProvider, _SqliteEntryMapping
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 TOPDIR = os.path.dirname(os.path.dirname(HERE))
@@ -86,6 +88,104 @@ class SiftsSummaryProviderTests(unittest.TestCase):
 
         logger.info("Completed %s at %s (%.4f seconds)", self.id(), time.strftime("%Y %m %d %H:%M:%S", time.localtime()), time.time() - self.__startTime)
 
+    def testSiftsSummaryReadFailure(self):
+        srcDirPath = os.path.join(HERE, "test-output", "sifts-summary-bad-src")
+        cachePath = os.path.join(HERE, "test-output", "CACHE-SIFTS-BAD")
+        for truncated in (False, True):
+            shutil.rmtree(srcDirPath, ignore_errors=True)
+            shutil.rmtree(cachePath, ignore_errors=True)
+            if truncated:
+                os.makedirs(srcDirPath)
+                for fileName, header, rowFmt in [
+                    ("pdb_chain_uniprot.csv.gz", "PDB,CHAIN,SP_PRIMARY,RES_BEG,RES_END,PDB_BEG,PDB_END,SP_BEG,SP_END", "%04d,A,P%05d,1,%d,1,%d,1,%d"),
+                    ("pdb_chain_pfam.csv.gz", "PDB,CHAIN,SP_PRIMARY,PFAM_ID,COVERAGE", "%04d,A,P%05d,PF%05d,%d"),
+                ]:
+                    filePath = os.path.join(srcDirPath, fileName)
+                    with gzip.open(filePath, "wt") as ofh:
+                        ofh.write("# test\n%s\n" % header)
+                        for ii in range(20000):
+                            ofh.write((rowFmt % ((ii,) * rowFmt.count("%"))) + "\n")
+                    with open(filePath, "rb") as ifh:
+                        data = ifh.read()
+                    with open(filePath, "wb") as ofh:
+                        ofh.write(data[: len(data) // 2])
+            # a missing or truncated source file must not produce a (partial) cache
+            su = SiftsSummaryProvider(srcDirPath=srcDirPath, cachePath=cachePath, useCache=False, abbreviated="TEST")
+            self.assertEqual(su.getEntryCount(), 0)
+            self.assertFalse(os.path.exists(os.path.join(cachePath, "sifts-summary", "sifts-summary-py3.pic")))
+
+    def testWriteReadSiftsSummaryCacheSqlite(self):
+        cacheKwargs = {"fmt": "sqlite"}
+        su = SiftsSummaryProvider(srcDirPath=self.__srcDirPath, cachePath=self.__cachePath, cacheKwargs=cacheKwargs, useCache=False, abbreviated="TEST")
+        eCountW = su.getEntryCount()
+        aLW = su.getIdentifiers("102M", "A", "UNPAL")
+        su = SiftsSummaryProvider(cachePath=self.__cachePath, cacheKwargs=cacheKwargs, useCache=True)
+        eCountR = su.getEntryCount()
+        self.assertGreaterEqual(eCountR, 140000)
+        self.assertEqual(eCountW, eCountR)
+        aL = su.getIdentifiers("102M", "A", "UNPAL")
+        self.assertEqual(len(aL), 1)
+        self.assertEqual(aLW, aL)
+        self.assertEqual(su.getAlignments("102M", "A"), aL)
+        saoL = su.getSeqAlignObjList("102M", "A")
+        self.assertEqual(len(saoL), 1)
+        self.assertEqual(saoL[0].getDbAccession(), aL[0]["UP"])
+        self.assertEqual(su.getIdentifiers("NOTANENTRY", "A", "UNPID"), [])
+        # the connection is released (e.g. before a stash backup) and reopened on the next access
+        su.close()
+        self.assertEqual(su.getIdentifiers("102M", "A", "UNPAL"), aL)
+        su.close()
+
+    def testSqliteEntryMapping(self):
+        dirPath = os.path.join(HERE, "test-output", "sifts-summary-sqlite")
+        shutil.rmtree(dirPath, ignore_errors=True)
+        os.makedirs(dirPath)
+        filePath = os.path.join(dirPath, "sifts-summary.db")
+        ssD = {
+            "102M": {"A": {"UNPAL": [("P02185", 1, 154, 1, 154)], "UNPID": ["P02185"], "PFAMID": ["PF00042"]}},
+            "2B7X": {"A": {"UNPAL": [], "UNPID": ["P0A7Y4"], "PFAMID": []}, "B": {"UNPAL": [("P0A7Y4", 2, 10, 5, 14)], "UNPID": ["P0A7Y4"], "PFAMID": []}},
+        }
+        _SqliteEntryMapping.write(filePath, ssD)
+        sqD = _SqliteEntryMapping(filePath)
+        self.assertEqual(len(sqD), 2)
+        self.assertEqual(sorted(sqD.keys()), ["102M", "2B7X"])
+        self.assertTrue("2B7X" in sqD)
+        self.assertFalse("1ABC" in sqD)
+        self.assertEqual(sqD["102M"], ssD["102M"])
+        self.assertEqual(sqD.get("2B7X"), ssD["2B7X"])
+        self.assertIsNone(sqD.get("1ABC"))
+        self.assertEqual(dict(sqD.items()), ssD)
+        # the connection is reopened on access after close()
+        sqD.close()
+        self.assertEqual(sqD["2B7X"]["B"]["UNPAL"], [("P0A7Y4", 2, 10, 5, 14)])
+        sqD.close()
+        # a failed write leaves the existing database in place
+        with self.assertRaises(Exception):
+            _SqliteEntryMapping.write(filePath, {"1ABC": {"A": {"UNPID": [lambda: None]}}})
+        self.assertFalse(os.path.exists(filePath + ".tmp"))
+        sqD = _SqliteEntryMapping(filePath)
+        self.assertEqual(dict(sqD.items()), ssD)
+        sqD.close()
+        shutil.rmtree(dirPath, ignore_errors=True)
+
+    def testSiftsSummaryCacheFormatConversion(self):
+        cachePath = os.path.join(HERE, "test-output", "CACHE-SIFTS-CONVERT")
+        cacheDirPath = os.path.join(cachePath, "sifts-summary")
+        shutil.rmtree(cachePath, ignore_errors=True)
+        os.makedirs(cacheDirPath)
+        ssD = {"102M": {"A": {"UNPAL": [("P02185", 1, 154, 1, 154)], "UNPID": ["P02185"], "PFAMID": ["PF00042"]}}}
+        _SqliteEntryMapping.write(os.path.join(cacheDirPath, "sifts-summary-py3.db"), ssD)
+        # a cache in another format is converted to the requested format
+        for fmt, fileName in [("pickle", "sifts-summary-py3.pic"), ("sqlite", "sifts-summary-py3.db")]:
+            su = SiftsSummaryProvider(cachePath=cachePath, cacheKwargs={"fmt": fmt}, useCache=True)
+            self.assertTrue(os.path.exists(os.path.join(cacheDirPath, fileName)))
+            self.assertEqual(su.getEntryCount(), 1)
+            self.assertEqual(su.getIdentifiers("102M", "A", "UNPAL"), [{"UP": "P02185", "BG": 1, "LEN": 154, "UBG": 1, "UND": 154}])
+            su.close()
+            if fmt == "pickle":
+                os.remove(os.path.join(cacheDirPath, "sifts-summary-py3.db"))
+        shutil.rmtree(cachePath, ignore_errors=True)
+
     @unittest.skipIf(platform.system() != "Darwin", "Skip long development troubleshooting test")
     def testWriteSiftsSummaryCacheJson(self):
         entrySaveLimit = 50
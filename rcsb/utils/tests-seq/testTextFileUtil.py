@@ -0,0 +1,93 @@
+##
+# File:    TextFileUtilTests.py
+# Date:    16-Oct-2026
+#
+# Update:
+##
+"""
+Test cases for opening plain and gzip-compressed text source files.
+
+"""
+
+import gzip
+import logging
+import os
+import random
+import shutil
+import unittest
+from unittest import mock
+
+from rcsb.utils.seq.TextFileUtil import openTextFile
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s]-%(module)s.%(funcName)s: %(message)s")
+logger = logging.getLogger()
+
+
+class TextFileUtilTests(unittest.TestCase):
+    def setUp(self):
+        self.__workPath = os.path.join(HERE, "test-output", "text-file-util")
+        os.makedirs(self.__workPath, exist_ok=True)
+        rnd = random.Random(7)
+        self.__lineL = ["%d,%s,%f\n" % (ii, "P%05d" % rnd.randrange(100000), rnd.random()) for ii in range(50000)]
+        self.__gzPath = os.path.join(self.__workPath, "rows.csv.gz")
+        with gzip.open(self.__gzPath, "wt", encoding="utf-8") as ofh:
+            ofh.write("\ufeff")
+            ofh.writelines(self.__lineL)
+        self.__truncPath = os.path.join(self.__workPath, "rows-truncated.csv.gz")
+        with open(self.__gzPath, "rb") as ifh:
+            data = ifh.read()
+        with open(self.__truncPath, "wb") as ofh:
+            ofh.write(data[: len(data) // 2])
+
+    def tearDown(self):
+        shutil.rmtree(self.__workPath, ignore_errors=True)
+
+    def __readAll(self, filePath):
+        with openTextFile(filePath) as ifh:
+            return list(ifh)
+
+    @mock.patch("rcsb.utils.seq.TextFileUtil.igzip_threaded", None)
+    @mock.patch("rcsb.utils.seq.TextFileUtil.rapidgzip", None)
+    def testReadTextFile(self):
+        filePath = os.path.join(self.__workPath, "rows.csv")
+        with open(filePath, "w", encoding="utf-8") as ofh:
+            ofh.writelines(self.__lineL)
+        self.assertEqual(self.__readAll(filePath), self.__lineL)
+        # the gzip process and the gzip module (no gzip executable) read the same rows (any byte order mark is dropped)
+        for gzipPath in (shutil.which("gzip"), None):
+            with mock.patch("shutil.which", return_value=gzipPath):
+                self.assertEqual(self.__readAll(self.__gzPath), self.__lineL)
+                # a reader closed before the end of the file does not raise
+                ifh = openTextFile(self.__gzPath)
+                self.assertEqual(ifh.readline(), self.__lineL[0])
+                ifh.close()
+
+    @mock.patch("rcsb.utils.seq.TextFileUtil.igzip_threaded", None)
+    @mock.patch("rcsb.utils.seq.TextFileUtil.rapidgzip", None)
+    def testReadFailure(self):
+        for gzipPath in (shutil.which("gzip"), None):
+            with mock.patch("shutil.which", return_value=gzipPath):
+                with self.assertRaises((OSError, EOFError)):
+                    self.__readAll(os.path.join(self.__workPath, "missing.csv.gz"))
+                with self.assertRaises((OSError, EOFError)):
+                    self.__readAll(self.__truncPath)
+
+    def testReadFailureDefaultBackend(self):
+        # the preferred backend (optional rapidgzip or python-isal when installed) also raises for truncated input
+        with self.assertRaises(Exception):
+            self.__readAll(self.__truncPath)
+
+
+def textFileUtilSuite():
+    suiteSelect = unittest.TestSuite()
+    suiteSelect.addTest(TextFileUtilTests("testReadTextFile"))
+    suiteSelect.addTest(TextFileUtilTests("testReadFailure"))
+    suiteSelect.addTest(TextFileUtilTests("testReadFailureDefaultBackend"))
+    return suiteSelect
+
+
+if __name__ == "__main__":
+    mySuite = textFileUtilSuite()
+    unittest.TextTestRunner(verbosity=2).run(mySuite)